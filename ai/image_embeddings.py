@@ -1,122 +1,25 @@
-# """
-# Image embedding service using Vertex AI Multimodal Embeddings.
-#
-# Uses multimodalembedding@001 for true image vector embeddings —
-# images are embedded directly into a shared vector space with text,
-# enabling cross-modal similarity search.
-# """
-#
-# import os
-# from pathlib import Path
-# import vertexai
-# from dotenv import load_dotenv
-# from google.cloud import aiplatform
-# from vertexai.vision_models import MultiModalEmbeddingModel, Image as VertexImage
-#
-# load_dotenv()
-#
-# # Vertex AI config from environment
-# GCP_PROJECT = os.getenv("GCP_PROJECT_ID") or os.getenv("GOOGLE_CLOUD_PROJECT")
-# GCP_LOCATION = os.getenv("GCP_LOCATION", "us-central1")
-# EMBEDDING_DIM = 1408  # multimodalembedding@001 max dimension
-#
-# # Lazy initialization — avoid crashing at import if GCP isn't configured
-# _model = None
-#
-#
-# def _get_model():
-#     """Lazily initialize Vertex AI and load the embedding model."""
-#     global _model
-#     if _model is None:
-#         if not GCP_PROJECT:
-#             raise ValueError("GCP_PROJECT_ID or GOOGLE_CLOUD_PROJECT environment variable not set.")
-#         vertexai.init(project=GCP_PROJECT, location="us-central1")
-#         _model = MultiModalEmbeddingModel.from_pretrained("multimodalembedding")
-#     return _model
-#
-#
-# def generate_image_embedding(image_path: str) -> list[float]:
-#     """
-#     Generate a vector embedding from a product image using Vertex AI.
-#
-#     Args:
-#         image_path: Absolute path to the image file on disk.
-#
-#     Returns:
-#         A list of floats (1408 dimensions). Raises Exception on failure.
-#     """
-#     filepath = Path(image_path)
-#     if not filepath.exists():
-#         raise FileNotFoundError(f"Image file not found: {image_path}")
-#
-#     # Load image directly from file path
-#     image = VertexImage.load_from_file(str(filepath))
-#
-#     # Get embedding — single API call, true visual embedding
-#     embeddings = _get_model().get_embeddings(
-#         image=image,
-#         dimension=EMBEDDING_DIM,
-#     )
-#
-#     embedding = embeddings.image_embedding
-#     if not embedding:
-#         raise ValueError("Vertex AI returned empty image embedding")
-#
-#     print(f"[OK] Generated image embedding ({len(embedding)} dims) for {filepath.name}")
-#     return list(embedding)
-#
-#
-# def generate_image_embedding_from_base64(base64_data: str) -> list[float]:
-#     """Generate embedding from base64 image string (e.g. from WhatsApp download)."""
-#     import base64, tempfile
-#
-#     image_bytes = base64.b64decode(base64_data)
-#
-#     with tempfile.NamedTemporaryFile(delete=False, suffix=".jpg") as tmp:
-#         tmp.write(image_bytes)
-#         tmp_path = tmp.name
-#
-#     try:
-#         return generate_image_embedding(tmp_path)
-#     finally:
-#         os.unlink(tmp_path)  # clean up temp file
-#
-#
-# def generate_text_embedding(text: str) -> list[float]:
-#     """
-#     Generate a text embedding in the same vector space as image embeddings.
-#     This enables cross-modal search: text queries match image vectors.
-#
-#     Args:
-#         text: Text description to embed (e.g. "red sneakers").
-#
-#     Returns:
-#         A list of floats (1408 dimensions). Raises Exception on failure.
-#     """
-#     embeddings = _get_model().get_embeddings(
-#         contextual_text=text,
-#         dimension=EMBEDDING_DIM,
-#     )
-#
-#     embedding = embeddings.text_embedding
-#     if not embedding:
-#         raise ValueError("Vertex AI returned empty text embedding")
-#
-#     return list(embedding)
-
 """ Image embedding service using Vertex AI with the new Gemini Multimodal Embeddings.
 Uses gemini-embedding-2-preview for true multimodal vector embeddings — images and text
 are embedded directly into a shared vector space, enabling cross-modal similarity search. """
 
+import asyncio
 import os
-import base64
+import hashlib
+import logging
+import tempfile
+import threading
 from pathlib import Path
+
+import numpy as np
+import pybase64
+from cachetools import LRUCache
 from dotenv import load_dotenv
+from tenacity import retry, retry_if_exception, stop_after_attempt, wait_exponential
 import config
 
 # Import the modern Google GenAI SDK
 from google import genai
-from google.genai import types
+from google.genai import errors, types
 
 from config import settings
 
@@ -128,87 +31,257 @@ GCP_LOCATION = "us-central1"
 EMBEDDING_DIM = 1408
 MODEL_ID = "gemini-embedding-2-preview"
 
-# Lazy initialization
+# Content-addressed embedding cache (blake2b of image bytes -> float16 .npy vector)
+CACHE_DIR = Path(settings.embedding_cache_dir)
+
+logger = logging.getLogger(__name__)
+
+# Lazy initialization (double-checked so concurrent worker threads build one client)
 _client = None
+_client_lock = threading.Lock()
 
 
 def _get_client():
     """Lazily initialize the Google GenAI client for Vertex AI."""
     global _client
     if _client is None:
-        if not GCP_PROJECT:
-            raise ValueError("GCP_PROJECT_ID or GOOGLE_CLOUD_PROJECT environment variable not set.")
-        # Initialize the unified client targeting Vertex AI
-        _client = genai.Client(vertexai=True, project=GCP_PROJECT, location=GCP_LOCATION)
+        with _client_lock:
+            if _client is None:
+                if not GCP_PROJECT:
+                    raise ValueError("GCP_PROJECT_ID or GOOGLE_CLOUD_PROJECT environment variable not set.")
+                # Initialize the unified client targeting Vertex AI
+                _client = genai.Client(vertexai=True, project=GCP_PROJECT, location=GCP_LOCATION)
     return _client
 
 
-def generate_image_embedding(image_path: str) -> list[float]:
-    """ Generate a vector embedding from a product image using Gemini Embedding 2. """
-    filepath = Path(image_path)
+def warmup():
+    """Build the embedding client at startup so the first request doesn't pay for it."""
+    try:
+        _get_client()
+    except Exception as e:
+        logger.warning("Embedding client warmup skipped: %s", e)
 
-    if not filepath.exists():
-        raise FileNotFoundError(f"Image file not found: {image_path}")
 
-    client = _get_client()
+def _is_retryable(exc: BaseException) -> bool:
+    """Retry only on quota (429) and transient availability (503) errors."""
+    return isinstance(exc, errors.APIError) and exc.code in (429, 503)
 
-    # Read image bytes and create a multimodal Part
-    with open(filepath, "rb") as f:
-        image_bytes = f.read()
 
-    # Infer mime type (defaulting to jpeg if not png)
-    mime_type = "image/png" if filepath.suffix.lower() == ".png" else "image/jpeg"
-    image_part = types.Part.from_bytes(data=image_bytes, mime_type=mime_type)
-
-    # Generate embedding using the unified embed_content method
-    response = client.models.embed_content(
+@retry(
+    retry=retry_if_exception(_is_retryable),
+    wait=wait_exponential(multiplier=0.5, max=8),
+    stop=stop_after_attempt(5),
+    reraise=True,
+)
+def _embed_content(contents):
+    """Single embed_content call with exponential backoff on rate limits."""
+    return _get_client().models.embed_content(
         model=MODEL_ID,
-        contents=image_part,
+        contents=contents,
         config=types.EmbedContentConfig(output_dimensionality=EMBEDDING_DIM)
     )
 
+
+def _cache_key(image_bytes: bytes) -> str:
+    """Content hash used to address cached image embeddings."""
+    return hashlib.blake2b(image_bytes, digest_size=16).hexdigest()
+
+
+def _cache_get(key: str) -> np.ndarray | None:
+    """Return a cached embedding, or None on a miss or unreadable entry."""
+    path = CACHE_DIR / f"{key}.npy"
+    if not path.exists():
+        return None
+    try:
+        # Stored as float16; upcast before handing to similarity code
+        return np.load(path).astype(np.float32)
+    except (OSError, ValueError):
+        return None
+
+
+def _cache_put(key: str, embedding: np.ndarray):
+    """
+    Persist an embedding. Written to a uniquely named temp file first so readers never see a
+    partial vector and concurrent writers of the same key don't collide. A failed write only
+    costs the cache entry, never the embedding.
+    """
+    tmp_path = None
+    try:
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=CACHE_DIR, prefix=f"{key}.", suffix=".tmp", delete=False) as f:
+            tmp_path = f.name
+            np.save(f, embedding.astype(np.float16))
+        os.replace(tmp_path, CACHE_DIR / f"{key}.npy")
+    except OSError as e:
+        logger.warning("Embedding cache write failed for %s: %s", key, e)
+        if tmp_path is not None:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+
+
+def _embed_image_bytes(image_bytes: bytes, mime_type: str) -> np.ndarray:
+    """Embed raw image bytes, serving repeat images from the on-disk cache."""
+    key = _cache_key(image_bytes)
+    cached = _cache_get(key)
+    if cached is not None:
+        return cached
+
+    image_part = types.Part.from_bytes(data=image_bytes, mime_type=mime_type)
+
+    # Generate embedding using the unified embed_content method
+    response = _embed_content(image_part)
+
     if not response.embeddings or not response.embeddings[0].values:
         raise ValueError("Vertex AI returned empty image embedding")
 
-    embedding = response.embeddings[0].values
-    print(f"[OK] Generated image embedding ({len(embedding)} dims) for {filepath.name}")
-    return list(embedding)
+    embedding = np.asarray(response.embeddings[0].values, dtype=np.float32)
+    _cache_put(key, embedding)
+    return embedding
 
 
-def generate_image_embedding_from_base64(base64_data: str) -> list[float]:
+def _mime_type_for(filename: str) -> str:
+    """Infer mime type (defaulting to jpeg if not png)."""
+    return "image/png" if Path(filename).suffix.lower() == ".png" else "image/jpeg"
+
+
+def generate_image_embedding(image_path: str) -> np.ndarray:
+    """ Generate a vector embedding from a product image using Gemini Embedding 2. """
+    filepath = Path(image_path)
+
+    # One read serves both the cache key and the API payload
+    try:
+        image_bytes = filepath.read_bytes()
+    except FileNotFoundError:
+        raise FileNotFoundError(f"Image file not found: {image_path}")
+
+    embedding = _embed_image_bytes(image_bytes, _mime_type_for(filepath.name))
+    logger.debug("Generated image embedding (%d dims) for %s", len(embedding), filepath.name)
+    return embedding
+
+
+def generate_image_embedding_from_bytes(image_bytes: bytes, filename: str = "") -> np.ndarray:
+    """Generate embedding from image bytes already in memory (e.g., a fresh upload)."""
+    return _embed_image_bytes(image_bytes, _mime_type_for(filename))
+
+
+def generate_image_embedding_from_base64(base64_data: str) -> np.ndarray:
     """Generate embedding from base64 image string (e.g., from WhatsApp download)."""
-    image_bytes = base64.b64decode(base64_data)
-    client = _get_client()
+    image_bytes = pybase64.b64decode(base64_data)
 
     # Directly pass bytes in memory—no need for temp files anymore!
-    image_part = types.Part.from_bytes(data=image_bytes, mime_type="image/jpeg")
+    embedding = _embed_image_bytes(image_bytes, "image/jpeg")
+    logger.debug("Generated image embedding (%d dims) from base64 data", len(embedding))
+    return embedding
 
-    response = client.models.embed_content(
-        model=MODEL_ID,
-        contents=image_part,
-        config=types.EmbedContentConfig(output_dimensionality=EMBEDDING_DIM)
-    )
 
-    if not response.embeddings or not response.embeddings[0].values:
-        raise ValueError("Vertex AI returned empty image embedding")
+# Memoized text embeddings, keyed on the normalized query string
+_text_cache = LRUCache(maxsize=4096)
+_text_cache_lock = threading.Lock()
 
-    embedding = response.embeddings[0].values
-    print(f"[OK] Generated image embedding ({len(embedding)} dims) from base64 data")
-    return list(embedding)
 
+def _normalize_text(text: str) -> str:
+    return " ".join(text.split()).lower()
 
-def generate_text_embedding(text: str) -> list[float]:
-    """ Generate a text embedding in the same vector space as image embeddings. """
-    client = _get_client()
 
-    response = client.models.embed_content(
-        model=MODEL_ID,
-        contents=text,
-        config=types.EmbedContentConfig(output_dimensionality=EMBEDDING_DIM)
-    )
+def _to_vector(values) -> np.ndarray:
+    embedding = np.asarray(values, dtype=np.float32)
+    embedding.flags.writeable = False  # shared by every caller of the memoized result
+    return embedding
 
-    if not response.embeddings or not response.embeddings[0].values:
+
+def _embed_texts(texts: list[str], memoize=True) -> list[np.ndarray]:
+    """Embed normalized texts in one request, falling back to one request per text if the batch fails."""
+    try:
+        response = _embed_content(texts)
+        if not response.embeddings or len(response.embeddings) != len(texts):
+            raise ValueError("Vertex AI returned a partial batch of text embeddings")
+        embeddings = [_to_vector(item.values) for item in response.embeddings]
+    except Exception as e:
+        if len(texts) == 1:
+            raise
+        logger.debug("Batched text embedding failed, embedding individually: %s", e)
+        embeddings = [_embed_texts([text], memoize)[0] for text in texts]
+
+    if any(embedding.size == 0 for embedding in embeddings):
         raise ValueError("Vertex AI returned empty text embedding")
+    if not memoize:
+        return embeddings
+    with _text_cache_lock:
+        for text, embedding in zip(texts, embeddings):
+            _text_cache[text] = embedding
+    return embeddings
+
+
+def _cached_text_embedding(text: str) -> np.ndarray | None:
+    with _text_cache_lock:
+        return _text_cache.get(text)
+
+
+class _TextEmbeddingBatcher:
+    """
+    Coalesces text-embedding requests that arrive within ``flush_ms`` (or until ``batch_size``
+    are waiting) into a single embed_content call. Each caller awaits its own future.
+    """
+
+    def __init__(self, batch_size=32, flush_ms=15):
+        self.batch_size = batch_size
+        self.flush_ms = flush_ms
+        self._pending: list[tuple[str, asyncio.Future]] = []
+        self._flush_handle: asyncio.TimerHandle | None = None
+        self._tasks: set[asyncio.Task] = set()
+
+    async def embed(self, text: str) -> np.ndarray:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future))
+        if len(self._pending) >= self.batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.flush_ms / 1000, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.create_task(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    @staticmethod
+    async def _run(batch):
+        texts = list(dict.fromkeys(text for text, _ in batch))  # identical queries share one input
+        try:
+            embeddings = dict(zip(texts, await asyncio.to_thread(_embed_texts, texts)))
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for text, future in batch:
+            if not future.done():
+                future.set_result(embeddings[text])
+
+
+_text_batcher = _TextEmbeddingBatcher()
+
+
+async def generate_text_embedding_async(text: str) -> np.ndarray:
+    """Async text embedding: served from the memo, otherwise micro-batched with concurrent queries."""
+    text = _normalize_text(text)
+    cached = _cached_text_embedding(text)
+    if cached is not None:
+        return cached
+    return await _text_batcher.embed(text)
+
 
-    embedding = response.embeddings[0].values
-    return list(embedding)
+async def generate_text_embeddings_uncached(texts: list[str]) -> list[np.ndarray]:
+    """
+    Embed one-off texts (e.g. stored messages) in a single request, bypassing the memo so they
+    don't evict the repeated search queries it holds.
+    """
+    return await asyncio.to_thread(_embed_texts, [_normalize_text(text) for text in texts], False)
@@ -0,0 +1,103 @@
+"""
+Long-term conversation memory.
+
+Only the recent tail of a conversation is sent to the model. Older messages are
+embedded in the background after each turn, and for long conversations the few
+earlier messages most similar to the current input are recalled alongside the tail.
+"""
+import asyncio
+import logging
+
+from sqlalchemy import bindparam, select, update
+
+from ai.image_embeddings import generate_text_embeddings_uncached
+from config import settings
+from database import AsyncSessionLocal
+from models import Message
+
+logger = logging.getLogger(__name__)
+
+MEMORY_RECALL_K = 4
+# Cosine distance above which an earlier message is not considered relevant
+MEMORY_MAX_DISTANCE = 0.5
+# Recall only once the history tail is full (get_conversation_history's limit); shorter
+# conversations are already sent in full
+MEMORY_MIN_HISTORY = 20
+MEMORY_INDEX_BATCH = 32
+
+# Per-customer scans are small and served by the (business_id, customer_id, timestamp) index, so
+# these use an exact distance sort rather than an ANN index
+_UNINDEXED_STMT = (
+    select(Message.id, Message.text)
+    .where(
+        Message.business_id == bindparam("business_id"),
+        Message.customer_id == bindparam("customer_id"),
+        Message.embedding.is_(None),
+        Message.text.isnot(None),
+        Message.text != "",
+    )
+    .order_by(Message.id.desc())
+    .limit(MEMORY_INDEX_BATCH)
+)
+
+# Strong references keep indexing tasks alive; one task per customer at a time
+_indexing: dict[tuple, asyncio.Task] = {}
+
+
+def schedule_indexing(business_id, customer_id):
+    """Embed the customer's not-yet-embedded messages in the background (call after a turn is saved)."""
+    if not settings.conversation_memory_enabled or business_id is None or customer_id is None:
+        return
+    key = (business_id, str(customer_id))
+    if key in _indexing:
+        return
+    task = asyncio.create_task(_index_messages(*key))
+    _indexing[key] = task
+    task.add_done_callback(lambda _: _indexing.pop(key, None))
+
+
+async def _index_messages(business_id, customer_id):
+    try:
+        async with AsyncSessionLocal() as db:
+            rows = (await db.execute(
+                _UNINDEXED_STMT, {"business_id": business_id, "customer_id": customer_id}
+            )).all()
+            if not rows:
+                return
+            # One request for the batch; message texts stay out of the query embedding memo
+            embeddings = await generate_text_embeddings_uncached([row.text for row in rows])
+            await db.execute(
+                update(Message),
+                [{"id": row.id, "embedding": embedding} for row, embedding in zip(rows, embeddings)],
+            )
+            await db.commit()
+    except Exception as e:
+        logger.warning("Conversation memory indexing failed for %s: %s", customer_id, e)
+
+
+async def drain():
+    """Wait for pending indexing tasks (call at shutdown, before disposing the engine)."""
+    if _indexing:
+        await asyncio.gather(*_indexing.values(), return_exceptions=True)
+
+
+async def recall(db, business_id, customer_id, query_embedding, recent_history):
+    """
+    Return up to MEMORY_RECALL_K earlier messages relevant to the query embedding, oldest first,
+    skipping anything already in the recent history.
+    """
+    distance = Message.embedding.cosine_distance(query_embedding)
+    result = await db.execute(
+        select(Message.id, Message.text, Message.is_bot)
+        .where(
+            Message.business_id == business_id,
+            Message.customer_id == str(customer_id),
+            Message.embedding.isnot(None),
+            distance < MEMORY_MAX_DISTANCE,
+        )
+        .order_by(distance)
+        .limit(MEMORY_RECALL_K + len(recent_history))
+    )
+    recent_texts = {msg["text"] for msg in recent_history}
+    memories = [row for row in result.all() if row.text not in recent_texts][:MEMORY_RECALL_K]
+    return [{"text": row.text, "is_bot": row.is_bot} for row in sorted(memories, key=lambda row: row.id)]
@@ -0,0 +1,147 @@
+"""
+Caches of final AI answers for repeated questions: an exact-match layer and a
+semantic (embedding-similarity) layer for paraphrases.
+
+Only tool-free answers are stored (tool results such as payments or stock are
+stateful). Entries are scoped per business so a persona or catalogue change can
+drop just that business's answers.
+"""
+import hashlib
+import re
+import threading
+import time
+import unicodedata
+
+import numpy as np
+from cachetools import TTLCache
+
+HISTORY_WINDOW = 4
+
+# Questions that usually trigger tools (stateful) or only make sense in context are never
+# answered from the semantic cache.
+SEMANTIC_SKIP_KEYWORDS = ("pay", "paid", "order", "buy", "total", "weather", "rate", "reference", "link")
+# Matched at the start of a word ("payment", "orders"), so "great" or "border" don't count
+_SEMANTIC_SKIP_RE = re.compile(r"\b(?:" + "|".join(SEMANTIC_SKIP_KEYWORDS) + ")")
+SEMANTIC_MIN_WORDS = 3
+
+
+def normalize_input(text):
+    """Normalize user text so trivially different spellings share a cache entry."""
+    return unicodedata.normalize("NFKC", text).strip().lower()
+
+
+class ResponseCache:
+    """TTL cache of AI answers keyed on (business_id, sha256 of the answer's context)."""
+
+    def __init__(self, maxsize=10_000, ttl=1800):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(business_id, system_prompt_hash, business_prompt, user_input, conversation_history=None,
+                 user_name=None):
+        """Hash everything that determines a tool-free answer."""
+        persona_hash = hashlib.sha256((business_prompt or "").encode("utf-8")).hexdigest()[:16]
+        parts = [str(business_id), system_prompt_hash, persona_hash, user_name or "", normalize_input(user_input)]
+        parts.extend(
+            f"{msg.get('sender')}:{msg.get('text')}" for msg in (conversation_history or [])[-HISTORY_WINDOW:]
+        )
+        return business_id, hashlib.sha256("|".join(parts).encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            return self._cache.get(key)
+
+    def set(self, key, response):
+        with self._lock:
+            self._cache[key] = response
+
+    def clear(self, business_id=None):
+        """Drop cached answers for one business, or everything."""
+        with self._lock:
+            if business_id is None:
+                self._cache.clear()
+                return
+            for key in [key for key in self._cache.keys() if key[0] == business_id]:
+                self._cache.pop(key, None)
+
+
+class SemanticCache:
+    """
+    Embedding-similarity cache for paraphrased questions ("price?" vs "how much is it?").
+
+    Entries are bucketed by (business_id, persona, user name) and matched by cosine
+    similarity of the normalized question embedding against a small in-memory matrix.
+    """
+
+    def __init__(self, threshold=0.92, max_entries=256, ttl=1800):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._buckets: dict[tuple, list[tuple[float, np.ndarray, str]]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_bucket(business_id, business_prompt, user_name=None):
+        persona_hash = hashlib.sha256((business_prompt or "").encode("utf-8")).hexdigest()[:16]
+        return business_id, persona_hash, user_name or ""
+
+    @staticmethod
+    def is_cacheable(user_input, conversation_history=None):
+        """
+        Cheap heuristic: skip short, context-dependent or likely tool-calling inputs. Buckets don't
+        include the conversation, so only a conversation's opening question is looked up or stored.
+        """
+        if conversation_history:
+            return False
+        text = normalize_input(user_input)
+        if len(text.split()) < SEMANTIC_MIN_WORDS:
+            return False
+        return _SEMANTIC_SKIP_RE.search(text) is None
+
+    @staticmethod
+    def _unit(embedding):
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def get(self, bucket, embedding):
+        with self._lock:
+            entries = self._live_entries(bucket)
+            if not entries:
+                return None
+            matrix = np.stack([entry[1] for entry in entries])
+            scores = matrix @ self._unit(embedding)
+            best = int(np.argmax(scores))
+            return entries[best][2] if scores[best] >= self.threshold else None
+
+    def set(self, bucket, embedding, response):
+        with self._lock:
+            entries = self._live_entries(bucket)
+            entries.append((time.monotonic() + self.ttl, self._unit(embedding), response))
+            del entries[:-self.max_entries]
+            self._buckets[bucket] = entries
+
+    def clear(self, business_id=None):
+        with self._lock:
+            if business_id is None:
+                self._buckets.clear()
+                return
+            for bucket in [bucket for bucket in self._buckets if bucket[0] == business_id]:
+                del self._buckets[bucket]
+
+    def _live_entries(self, bucket):
+        now = time.monotonic()
+        entries = [entry for entry in self._buckets.get(bucket, []) if entry[0] > now]
+        self._buckets[bucket] = entries
+        return entries
+
+
+response_cache = ResponseCache()
+semantic_cache = SemanticCache()
+
+
+def clear_response_cache(business_id=None):
+    """Invalidate cached answers, e.g. after a persona or product change."""
+    response_cache.clear(business_id)
+    semantic_cache.clear(business_id)
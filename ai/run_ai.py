@@ -1,70 +1,162 @@
 import asyncio
-import contextvars
+import hashlib
 import inspect
-import json
 import logging
 import os
 
+import httpx
+import orjson
+from cachetools import TTLCache
 from dotenv import load_dotenv
 from openai import AsyncOpenAI
-from pydantic import BaseModel, Field
-from sqlalchemy import delete
+from sqlalchemy import bindparam, delete, insert
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from ai import memory, session_cache
+from ai.image_embeddings import generate_text_embedding_async
 from ai.prompts import system_prompt
+from ai.response_cache import response_cache, semantic_cache
 from ai.tools import get_weather, get_exchange_rate, get_products, tools, get_rate, search_similar_products, \
     search_by_image, get_total
+from config import settings
+from database import AsyncSessionLocal
+import message_events
 from models import Message, Business
 from payment.payment import initialize_payment, verify_payment
 
 load_dotenv()
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+# Logging is configured by the application (configure_logging) rather than on import
 logger = logging.getLogger(__name__)
 
+# Environment is read once at import; nothing on the request path calls os.getenv
 api_key = os.getenv("OPENAI_API_KEY")
 ai_model = os.getenv("OPEN_ROUTER_MODEL")
+summary_model = os.getenv("OPEN_ROUTER_SUMMARY_MODEL") or ai_model
+PAYSTACK_CALLBACK_URL = f"{os.getenv('AI_BASE_URL')}/paystack/callback"
+
+if not ai_model:
+    logger.warning("OPEN_ROUTER_MODEL is not set; AI responses will fail until it is configured.")
 
 client: AsyncOpenAI | None = None
 
 
+def _normalize_tool(tool):
+    """Return a tool spec in the {"type": "function", "function": {...}} shape the API expects."""
+    if tool.get("type") == "function" and "function" in tool:
+        return tool
+    logger.warning("Tool spec %r is missing the function wrapper; wrapping it at import.", tool.get("name"))
+    return {"type": "function", "function": tool}
+
+
+# ✅ The tool schema is static: send it as a prebuilt body field so the SDK doesn't re-walk and
+# re-transform every tool definition on each completion call. Normalized once, sorted by name and frozen
+# so the request bytes (and the provider's prompt-cache prefix) never change at runtime -- don't mutate it.
+_TOOLS_FROZEN = tuple(sorted(map(_normalize_tool, tools), key=lambda tool: tool["function"]["name"]))
+_TOOLS_BODY = {"tools": _TOOLS_FROZEN}
+# Serialized once at import; identifies the tool schema version alongside the system prompt
+_TOOLS_JSON = orjson.dumps(_TOOLS_FROZEN)
+
+# The static system prompt is marked as a provider-side prompt-cache breakpoint so its
+# tokens are processed once and reused across calls; the hash identifies the prompt and tool
+# schema version, so cached answers are dropped when either changes.
+SYSTEM_PROMPT_HASH = hashlib.blake2b(system_prompt.encode("utf-8") + _TOOLS_JSON).hexdigest()[:8]
+_SYSTEM_PROMPT_PART = {"type": "text", "text": system_prompt, "cache_control": {"type": "ephemeral"}}
+_BASE_SYSTEM_MESSAGE = {"role": "system", "content": [_SYSTEM_PROMPT_PART]}
+
+# ✅ Per-business system message (static prompt + persona), rebuilt only when the persona changes.
+# Messages are laid out as [static system][history][dynamic context][current turn] so the
+# provider prefix cache keeps hitting as the conversation grows.
+_prefix_cache: dict[int, tuple[str, dict]] = {}
+
+
+def _get_system_message(business_id, business_prompt):
+    """Return the byte-stable system message for a business."""
+    if not business_prompt:
+        return _BASE_SYSTEM_MESSAGE
+    cached = _prefix_cache.get(business_id)
+    if cached and cached[0] == business_prompt:
+        return cached[1]
+    system_message = {"role": "system", "content": [_SYSTEM_PROMPT_PART, {"type": "text", "text": business_prompt}]}
+    _prefix_cache[business_id] = (business_prompt, system_message)
+    return system_message
+
+
+EXPLICIT_PROMPT_CACHE = (ai_model or "").startswith("anthropic/")
+
+
+def _with_cache_breakpoint(message):
+    """Return a copy of a message whose last content part carries an ephemeral cache_control marker."""
+    content = message["content"]
+    parts = [{"type": "text", "text": content}] if isinstance(content, str) else list(content)
+    parts[-1] = {**parts[-1], "cache_control": {"type": "ephemeral"}}
+    return {**message, "content": parts}
+
+
+# ✅ Persona per business, so a chat turn doesn't pay a Business SELECT. The TTL bounds staleness
+# across workers; the worker that saves settings invalidates immediately.
+_persona_cache = TTLCache(maxsize=1024, ttl=300)
+
+
+# Persona lookup built once at import; only the bound business_id changes per call
+_PERSONA_STMT = select(Business.persona).where(Business.id == bindparam("business_id"))
+
+
+async def _get_persona(business_id, db):
+    """Return the business persona, hitting the database only on a cache miss."""
+    if business_id is None:
+        return None
+    if business_id in _persona_cache:
+        return _persona_cache[business_id]
+    result = await db.execute(_PERSONA_STMT, {"business_id": business_id})
+    persona = result.scalar_one_or_none()
+    _persona_cache[business_id] = persona
+    return persona
+
+
+def invalidate_persona(business_id):
+    """Forget a business's cached persona and system message (call after updating Business.persona)."""
+    _persona_cache.pop(business_id, None)
+    _prefix_cache.pop(business_id, None)
+
+
 def startup_ai_client():
     """Initialize the AI client. This should be called at application startup."""
     global client
     logger.info("Initializing OpenAI client...")
+    # One shared keep-alive pool so concurrent chats reuse connections to OpenRouter
     client = AsyncOpenAI(
         base_url="https://openrouter.ai/api/v1",
-        api_key=api_key
+        api_key=api_key,
+        http_client=httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=50),
+            timeout=httpx.Timeout(60.0, connect=10.0),
+        ),
     )
     logger.info("OpenAI client initialized.")
 
 
-# ✅ Store business_id as a context variable
-_current_business_id = contextvars.ContextVar("current_business_id", default=None)
-
-
-def set_business_context(business_id):
-    """Set the business context for the current request"""
-    _current_business_id.set(business_id)
-
-
-def get_business_context():
-    """Get the current business context"""
-    return _current_business_id.get()
-
-
-# Add a module-level variable alongside _current_business_id
-_current_image_data = contextvars.ContextVar("current_image_data", default=None)  # base64 string
+async def shutdown_ai_client():
+    """Close the AI client's connection pool. This should be called at application shutdown."""
+    global client
+    if client:
+        await client.close()
+        client = None
 
 
-def set_image_context(image_data):
-    _current_image_data.set(image_data)
+# Built image_url parts keyed by image hash, so a re-sent image reuses the same byte-identical part
+_image_part_cache = TTLCache(maxsize=32, ttl=600)
 
 
-def get_image_context():
-    return _current_image_data.get()
+def _get_image_part(image_data):
+    """Return (short hash, image_url content part) for a base64 image."""
+    image_hash = hashlib.blake2b(image_data.encode("ascii"), digest_size=8).hexdigest()
+    part = _image_part_cache.get(image_hash)
+    if part is None:
+        part = {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{image_data}"}}
+        _image_part_cache[image_hash] = part
+    return image_hash, part
 
 
 available_functions = {
@@ -81,13 +173,8 @@ available_functions = {
 }
 
 
-class WeatherResponse(BaseModel):
-    temperature: float = Field(description="Temperature in degrees Celsius")
-    response: str = Field(description="A natural language response to the user query.")
-
-
-async def call_function(function_name, db, business_id=None, **kwargs):
-    """Call a function, injecting business_id if needed"""
+async def call_function(function_name, db, business_id=None, image_data=None, **kwargs):
+    """Call a function, injecting the request's db, business_id and image data where needed"""
     # ✅ Inject business_id for get_products
     if function_name == "get_products" and business_id:
         kwargs['db'] = db
@@ -99,34 +186,178 @@ async def call_function(function_name, db, business_id=None, **kwargs):
     if function_name == "initialize_payment" and not kwargs.get('callback_url'):
         kwargs['db'] = db
         kwargs['business_id'] = business_id
-        kwargs['callback_url'] = f"{os.getenv('AI_BASE_URL')}/paystack/callback"
+        kwargs['callback_url'] = PAYSTACK_CALLBACK_URL
     if function_name == "verify_payment" and 'callback_url' not in kwargs:
         kwargs['db'] = db
     if function_name == "search_by_image" and business_id:
         kwargs['db'] = db
         kwargs['business_id'] = business_id
         # Use the actual downloaded image data instead of whatever URL the AI invented
-        if get_image_context():
-            kwargs['image_data'] = get_image_context()
+        if image_data:
+            kwargs['image_data'] = image_data
             kwargs.pop('image_url', None)  # remove hallucinated URL
     if function_name == "get_total" and business_id:
         kwargs['db'] = db
         kwargs['business_id'] = business_id
 
     if function_name not in available_functions:
-        logger.error(f"Tool '{function_name}' called by ai but not found in available_functions.")
+        logger.error("Tool '%s' called by ai but not found in available_functions.", function_name)
         return "Error: Tool not found."
 
     func = available_functions[function_name]
 
-    if inspect.iscoroutinefunction(func):
-        return await func(**kwargs)
+    async def run():
+        if inspect.iscoroutinefunction(func):
+            return await func(**kwargs)
+        # Blocking HTTP tools run in a worker thread so gathered tool calls actually overlap
+        return await asyncio.to_thread(func, **kwargs)
+
+    if function_name in SINGLE_FLIGHT_TOOLS:
+        try:
+            key = (function_name, orjson.dumps({k: v for k, v in kwargs.items() if k != 'db'},
+                                               option=orjson.OPT_SORT_KEYS))
+        except TypeError:
+            return await run()
+        return await _single_flight(key, run)
+    return await run()
+
+
+# ✅ Read-only tools: identical calls in flight at the same time (across requests) share one execution.
+# Payment tools and get_rate (creates a quote) are stateful and always run.
+SINGLE_FLIGHT_TOOLS = {"get_weather", "get_exchange_rate", "get_products", "search_similar_products", "get_total"}
+_inflight: dict[tuple, asyncio.Future] = {}
+
+
+async def _single_flight(key, run):
+    """Run ``run()`` once per key; concurrent callers with the same key await the same result."""
+    future = _inflight.get(key)
+    if future is not None:
+        return await asyncio.shield(future)
+
+    future = asyncio.get_running_loop().create_future()
+    _inflight[key] = future
+    try:
+        result = await run()
+    except asyncio.CancelledError:
+        future.cancel()
+        raise
+    except Exception as e:
+        future.set_exception(e)
+        future.exception()  # mark retrieved so an unawaited failure isn't logged as unhandled
+        raise
     else:
-        return func(**kwargs)
+        future.set_result(result)
+        return result
+    finally:
+        _inflight.pop(key, None)
+
+
+# ✅ History beyond this budget has its older turns folded into a running summary per conversation
+HISTORY_TOKEN_BUDGET = 4096
+HISTORY_KEEP_TAIL = 6
+# Messages get_conversation_history returns by default
+HISTORY_WINDOW = 20
+SUMMARY_MAX_TOKENS = 500
+
+
+def _estimate_tokens(text):
+    """Cheap token estimate (~4 characters per token); good enough for a budget check."""
+    return len(text or "") // 4 + 1
+
+
+async def _summarize_history(previous_summary, history):
+    """Fold older turns into the conversation's summary with one model call."""
+    transcript = "\n".join(f"{'Assistant' if msg['is_bot'] else 'User'}: {msg['text']}" for msg in history)
+    if previous_summary:
+        transcript = f"Summary of the conversation so far: {previous_summary}\n\n{transcript}"
+
+    completion = await client.chat.completions.create(
+        model=summary_model,
+        messages=[
+            {"role": "system", "content": "Summarize this customer conversation in a few sentences. Keep names, "
+                                          "products, quantities, totals, order references and open questions."},
+            {"role": "user", "content": transcript},
+        ],
+        max_tokens=SUMMARY_MAX_TOKENS,
+    )
+    return completion.choices[0].message.content or ""
+
+
+def _history_tokens(history):
+    return sum(_estimate_tokens(msg["text"]) for msg in history)
+
+
+async def compact_history(history, business_id=None, customer_id=None, max_tokens=HISTORY_TOKEN_BUDGET,
+                          keep_tail=HISTORY_KEEP_TAIL, window=HISTORY_WINDOW):
+    """
+    Keep the conversation under a token budget.
+
+    Returns (summary, tail). Older turns are folded into a running summary stored per conversation
+    with the id of the last message it covers, so the summary (and the prompt prefix) stays the same
+    from turn to turn. It is only extended, with one model call, once the messages after it go over
+    budget or are about to slide out of the history window.
+    """
+    history = history or []
+    if business_id is None or customer_id is None or any(msg.get("id") is None for msg in history):
+        # Nothing to anchor a stored summary to: keep the recent tail when over budget
+        if _history_tokens(history) <= max_tokens:
+            return None, history
+        return None, history[-keep_tail:]
+
+    state = await session_cache.get_summary(business_id, customer_id)
+    summary, through = (state["summary"], state["through"]) if state else (None, 0)
+    pending = [msg for msg in history if msg["id"] > through]
+
+    over_budget = _history_tokens(pending) > max_tokens
+    # Each turn adds two messages; extend the summary before unsummarized ones leave the window
+    leaving_window = summary is not None and len(pending) >= window - 2
+    if not (over_budget or leaving_window) or len(pending) <= keep_tail:
+        return summary, pending
+
+    evicted, tail = pending[:-keep_tail], pending[-keep_tail:]
+    try:
+        summary = await _summarize_history(summary, evicted)
+    except Exception as e:
+        logger.warning("History summarization failed, dropping older turns instead: %s", e)
+        return summary, tail
+    await session_cache.set_summary(business_id, customer_id, summary, evicted[-1]["id"])
+    return summary, tail
+
+
+async def _recall_memories(db, business_id, customer_id, user_input, query_embedding, history):
+    """Earlier messages relevant to this input, once the history tail no longer holds the whole conversation."""
+    if not settings.conversation_memory_enabled or business_id is None or customer_id is None \
+            or len(history) < memory.MEMORY_MIN_HISTORY:
+        return []
+    try:
+        if query_embedding is None:
+            query_embedding = await generate_text_embedding_async(user_input)
+        return await memory.recall(db, business_id, customer_id, query_embedding, history)
+    except Exception as e:
+        logger.warning("Conversation memory recall skipped: %s", e)
+        return []
+
+
+def _history_messages(history):
+    """
+    Map stored messages to chat messages, dropping empty texts and verbatim repeats of the
+    previous message from the same side (double sends, webhook retries). Deterministic, so
+    the same history always yields the same prompt prefix.
+    """
+    messages = []
+    for msg in history:
+        text = msg["text"]
+        if not text:
+            continue
+        role = "assistant" if msg["is_bot"] else "user"
+        if messages and messages[-1]["role"] == role and messages[-1]["content"] == text:
+            continue
+        messages.append({"role": role, "content": text})
+    return messages
 
 
 async def get_ai_response(user_input, db, conversation_history=None, business_id=None, user_name=None, image_data=None,
-                          image_url=None):
+                          image_url=None, customer_id=None):
     """
     Get AI response with conversation context and tool calling.
 
@@ -138,78 +369,75 @@ async def get_ai_response(user_input, db, conversation_history=None, business_id
         user_name: Optional name of the sender to personalize the response
         image_data: Optional base64-encoded image data for vision analysis
     """
-    # ✅ Set business context for this request
-    if business_id:
-        set_business_context(business_id)
-    if image_data:
-        set_image_context(image_data)  # ← add this
-    else:
-        set_image_context(None)  # ← clear it if no image
+    # 1. Build base messages (the static system message is built once at import)
+    business_prompt = await _get_persona(business_id, db)
+    messages = [_get_system_message(business_id, business_prompt)]
+
+    # ✅ Serve repeated questions from cache (images always go to the model)
+    cache_key = None
+    if not image_data:
+        cache_key = response_cache.make_key(business_id, SYSTEM_PROMPT_HASH, business_prompt, user_input,
+                                            conversation_history, user_name)
+        cached_response = response_cache.get(cache_key)
+        if cached_response is not None:
+            logger.info("AI response served from cache.")
+            return cached_response
+
+    # ✅ Fall back to the semantic cache for paraphrases of questions already answered
+    semantic_bucket = query_embedding = None
+    if not image_data and semantic_cache.is_cacheable(user_input, conversation_history):
+        semantic_bucket = semantic_cache.make_bucket(business_id, business_prompt, user_name)
+        try:
+            query_embedding = await generate_text_embedding_async(user_input)
+        except Exception as e:
+            logger.debug("Semantic cache skipped (embedding failed): %s", e)
+        if query_embedding is not None:
+            cached_response = semantic_cache.get(semantic_bucket, query_embedding)
+            if cached_response is not None:
+                logger.info("AI response served from semantic cache.")
+                return cached_response
+
+    # Use the passed conversation_history instead of fetching it again.
+    # History is appended verbatim so earlier turns stay byte-identical between calls.
+    recent_history = conversation_history or []
+    history_summary, conversation_history = await compact_history(conversation_history, business_id, customer_id)
+    if history_summary:
+        messages.append({"role": "system", "content": f"Summary of earlier conversation: {history_summary}"})
+    if conversation_history:
+        messages.extend(_history_messages(conversation_history))
 
-    # 1. Build base messages
-    messages = [
-        {"role": "system", "content": system_prompt}
-    ]
+    # ✅ Long conversations: recall relevant earlier messages that fell out of the recent tail
+    memories = await _recall_memories(db, business_id, customer_id, user_input, query_embedding, recent_history)
+    if memories:
+        lines = "\n".join(f"{'You' if msg['is_bot'] else 'Customer'}: {msg['text']}" for msg in memories)
+        messages.append({"role": "system", "content": f"Relevant earlier messages from this conversation:\n{lines}"})
 
-    business_result = await db.execute(select(Business).filter_by(id=business_id))
-    business_obj = business_result.scalar_one_or_none()
-    business_prompt = business_obj.persona if business_obj else None
-    if business_prompt:
-        messages = [
-            {"role": "system", "content": system_prompt + business_prompt}
-        ]
-    # ✅ Add user name context if available
+    # ✅ Dynamic context goes after the history, just before the current turn
     if user_name:
         messages.append({"role": "system", "content": f"The user's name is {user_name}."})
 
-    # Use the passed conversation_history instead of fetching it again
-    if conversation_history:
-        for msg in conversation_history:
-            role = "assistant" if msg["is_bot"] else "user"
-
-            if role == "user":
-                # Use customer_name if available, otherwise fallback to generic 'user'
-                name_to_use = msg.get("customer_name") or "User"
-                messages.append({
-                    "role": "user",
-                    "content": f"{name_to_use} said: {msg['text']}"
-                })
-            else:
-                messages.append({
-                    "role": "assistant",
-                    "content": msg["text"]
-                })
-
     # ✅ Append the current user message with optional image
+    image_hash = None
     if image_data:
         # For vision models, use content array with text and image
+        image_hash, image_part = _get_image_part(image_data)
         messages.append({
             "role": "user",
-            "content": [
-                {"type": "text", "text": user_input},
-                {
-                    "type": "image_url",
-                    "image_url": {
-                        "url": f"data:image/jpeg;base64,{image_data}"
-                    }
-                }
-            ]
+            "content": [{"type": "text", "text": user_input}, image_part]
         })
     else:
         messages.append({"role": "user", "content": user_input})
 
-    # Log messages safely (truncate base64 images)
-    messages_log = []
-    for msg in messages:
-        content = msg.get("content")
-        if isinstance(content, list):
-            msg = msg.copy()
-            msg["content"] = [
-                (item | {"image_url": "TRUNCATED"}) if item.get("type") == "image_url" else item
-                for item in content
-            ]
-        messages_log.append(msg)
-    logger.info(f"Sending messages to AI: {messages_log}")
+    # ✅ Anthropic only caches up to explicit breakpoints: mark the end of the turn's stable head so
+    # post-tool calls (same list, tool results appended) re-read it from cache. OpenAI-routed models
+    # cache prefixes automatically.
+    if EXPLICIT_PROMPT_CACHE:
+        messages[-1] = _with_cache_breakpoint(messages[-1])
+
+    # Log messages safely (the image is logged by hash only); the context is only formatted at DEBUG
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Sending messages to AI: %s + user turn %r%s", messages[:-1], user_input,
+                     f" with image {image_hash}" if image_hash else "")
 
     try:
         # 2. First model call
@@ -223,108 +451,145 @@ async def get_ai_response(user_input, db, conversation_history=None, business_id
             completion = await client.chat.completions.create(
                 model=ai_model,
                 messages=messages,
-                tools=tools,
+                extra_body=_TOOLS_BODY,
             )
             
             response_message = completion.choices[0].message
-            logger.info(f"AI Response (iter {iteration+1}): {response_message}")
+            logger.debug("AI Response (iter %d): %s", iteration + 1, response_message)
 
             if not response_message.tool_calls:
                 # No more tools needed, return direct response
                 final_response = response_message.content or "I have processed your request."
                 if not final_response.strip():
                     final_response = "I have processed your request."
-                logger.info(f"AI Final Response: {final_response}")
+                logger.info("AI Final Response: %s", final_response)
+                # Only tool-free answers are cacheable; tool results are stateful (payments, stock)
+                if cache_key and iteration == 0 and response_message.content:
+                    response_cache.set(cache_key, final_response)
+                    if semantic_bucket is not None and query_embedding is not None:
+                        semantic_cache.set(semantic_bucket, query_embedding, final_response)
                 return final_response
 
             logger.info("🔧 Tool calls detected!")
             
-            # Convert response_message to dict to avoid OpenRouter 500 errors
+            # Convert response_message to dict to avoid OpenRouter 500 errors (only the fields the API
+            # reads, rather than a full model_dump of each tool call)
             assistant_msg = {
                 "role": "assistant",
                 "content": response_message.content,
-                "tool_calls": [tool_call.model_dump() for tool_call in response_message.tool_calls]
+                "tool_calls": [
+                    {
+                        "id": tool_call.id,
+                        "type": "function",
+                        "function": {"name": tool_call.function.name, "arguments": tool_call.function.arguments},
+                    }
+                    for tool_call in response_message.tool_calls
+                ]
             }
             messages.append(assistant_msg)
 
             # Execute all tool calls in parallel
-            # We use a lock for tools that require the shared DB session to avoid race conditions
+            # AsyncSession isn't safe for concurrent use: read-only lookups get their own session when
+            # they share a turn with other calls, payment tools write through the request session under a lock
             db_lock = asyncio.Lock()
-            db_tools = {"get_products", "search_similar_products", "search_by_image", "verify_payment", "initialize_payment"}
+            read_db_tools = {"get_products", "search_similar_products", "search_by_image", "get_total"}
+            write_db_tools = {"verify_payment", "initialize_payment"}
+            parallel = len(response_message.tool_calls) > 1
 
             async def execute_tool(tool_call):
                 function_name = tool_call.function.name
                 
                 try:
-                    function_args = json.loads(tool_call.function.arguments)
+                    function_args = orjson.loads(tool_call.function.arguments)
                 except Exception as e:
-                    logger.error(f"Failed to parse function arguments: {e}")
+                    logger.error("Failed to parse function arguments: %s", e)
                     function_args = {}
                     
-                logger.info(f"Calling tool: {function_name} with {function_args}")
+                logger.info("Calling tool: %s with %s", function_name, function_args)
 
                 try:
                     # Execute the tool (business_id injected in call_function)
-                    # Acquire lock only if the tool uses the DB session
-                    if function_name in db_tools:
+                    if parallel and function_name in read_db_tools:
+                        async with AsyncSessionLocal() as tool_db:
+                            function_result = await call_function(function_name, db=tool_db,
+                                                                  business_id=business_id,
+                                                                  image_data=image_data, **function_args)
+                    # Acquire lock only if the tool uses the shared DB session
+                    elif function_name in read_db_tools | write_db_tools:
                         async with db_lock:
                             function_result = await call_function(function_name, db=db, business_id=business_id,
-                                                                  **function_args)
+                                                                  image_data=image_data, **function_args)
                     else:
                         function_result = await call_function(function_name, db=db, business_id=business_id,
-                                                              **function_args)
+                                                              image_data=image_data, **function_args)
                 except Exception as e:
-                    logger.error(f"Error executing tool {function_name}: {e}")
+                    logger.error("Error executing tool %s: %s", function_name, e)
                     function_result = {"error": str(e)}
 
                 # Log result safely (truncate if too long)
                 result_str = str(function_result)
-                logger.info(
-                    f"Tool Result: {result_str[:200]}..." if len(result_str) > 200 else f"Tool Result: {result_str}")
+                logger.info("Tool Result: %s", result_str[:200] + ("..." if len(result_str) > 200 else ""))
 
                 return {
                     "role": "tool",
                     "tool_call_id": tool_call.id,
                     "name": function_name,
-                    "content": json.dumps(function_result)
+                    "content": orjson.dumps(function_result,
+                                            option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_SORT_KEYS).decode()
                 }
 
             tool_outputs = await asyncio.gather(*(execute_tool(tc) for tc in response_message.tool_calls))
             messages.extend(tool_outputs)
 
-        logger.warning(f"Max tool iterations ({max_tool_iterations}) reached.")
+        logger.warning("Max tool iterations (%s) reached.", max_tool_iterations)
         return "I am taking too long to process this request. Let me know if you need anything else."
 
     except Exception as e:
-        logger.error(f"AI Response Error: {e}", exc_info=True)
+        logger.error("AI Response Error: %s", e, exc_info=True)
         return "Sorry, I'm having trouble responding right now."
 
 
+# ✅ History reads, built once at import and executed with bound parameters. Each filters on a single
+# customer column so the (business_id, customer_id, timestamp) index serves the query; the web chat
+# stores the username in both columns. Messages saved in one transaction share a timestamp, so id
+# keeps them in insert order.
+def _history_stmt(customer_column):
+    return (
+        select(Message.id, Message.sender, Message.text, Message.customer_name, Message.is_bot)
+        .where(Message.business_id == bindparam("business_id"), customer_column == bindparam("customer"))
+        .order_by(Message.timestamp.desc(), Message.id.desc())
+        .limit(bindparam("limit"))
+    )
+
+
+_HISTORY_BY_CUSTOMER_ID = _history_stmt(Message.customer_id)
+_HISTORY_BY_CUSTOMER_NAME = _history_stmt(Message.customer_name)
+
+
 async def get_conversation_history(business_id, customer_id: int | None, customer_name: str | None, db: AsyncSession,
-                                   limit=20):
+                                   limit=HISTORY_WINDOW):
     """Retrieve recent conversation history for a specific business and customer."""
-    from sqlalchemy import or_
-    results = await db.execute(
-        select(Message)
-        .filter(
-            Message.business_id == business_id,
-            or_(Message.customer_id == customer_id, Message.customer_name == customer_name)
-        )
-        .order_by(Message.timestamp.desc())
-        .limit(limit)
-    )
+    session_id = customer_id if customer_id is not None else customer_name
+    cached = await session_cache.get_messages(business_id, session_id, limit)
+    if cached is not None:
+        return cached
 
-    recent_messages = results.scalars().all()
+    generation = await session_cache.history_generation(business_id, session_id)
+    stmt = _HISTORY_BY_CUSTOMER_ID if customer_id is not None else _HISTORY_BY_CUSTOMER_NAME
+    results = await db.execute(stmt, {"business_id": business_id, "customer": session_id, "limit": limit})
 
-    return [
+    history = [
         {
-            'sender': msg.sender,
-            'text': msg.text,
-            'customer_name': msg.customer_name,
-            'is_bot': msg.is_bot
+            'id': row.id,
+            'sender': row.sender,
+            'text': row.text,
+            'customer_name': row.customer_name,
+            'is_bot': row.is_bot
         }
-        for msg in reversed(recent_messages)
+        for row in reversed(results.all())
     ]
+    await session_cache.set_messages(business_id, session_id, history, generation)
+    return history
 
 
 async def update_conversation_history(db, business_id, text, sender, customer_id=None, customer_name=None, is_bot=False,
@@ -340,10 +605,78 @@ async def update_conversation_history(db, business_id, text, sender, customer_id
         platform=platform
     )
     db.add(new_msg)
+    await message_events.publish(db, business_id, customer_id)
     await db.commit()
+
+    # Keep the cached history tail in step with the table
+    await session_cache.append_message(
+        business_id,
+        customer_id if customer_id is not None else customer_name,
+        {'id': new_msg.id, 'sender': sender, 'text': text, 'customer_name': customer_name, 'is_bot': is_bot},
+    )
+    if customer_id is not None:
+        await session_cache.clear_customers(business_id)
+    if is_bot:
+        memory.schedule_indexing(business_id, customer_id)
     return new_msg
 
 
+# ✅ History writes that don't need to finish before replying run as tasks on their own session.
+# Strong references keep the tasks alive until they complete.
+_background_writes: set[asyncio.Task] = set()
+
+
+def schedule_conversation_write(business_id, text, sender, customer_id=None, customer_name=None, is_bot=False,
+                                platform="web") -> asyncio.Task:
+    """Save a message in the background; await the returned task where ordering matters."""
+    async def write():
+        try:
+            async with AsyncSessionLocal() as write_db:
+                await update_conversation_history(write_db, business_id, text, sender, customer_id=customer_id,
+                                                  customer_name=customer_name, is_bot=is_bot, platform=platform)
+        except Exception as e:
+            logger.error("Failed to save conversation message: %s", e, exc_info=True)
+
+    task = asyncio.create_task(write())
+    _background_writes.add(task)
+    task.add_done_callback(_background_writes.discard)
+    return task
+
+
+async def drain_background_writes():
+    """Wait for pending background history writes (call at shutdown, before disposing the engine)."""
+    if _background_writes:
+        await asyncio.gather(*_background_writes, return_exceptions=True)
+    await memory.drain()
+
+
+async def update_conversation_history_pair(db, business_id, user_text, bot_text, sender, customer_id=None,
+                                           customer_name=None, platform="web"):
+    """Save a user message and the bot's reply with a single INSERT and commit."""
+    rows = [
+        {'business_id': business_id, 'text': user_text, 'sender': sender, 'customer_id': customer_id,
+         'customer_name': customer_name, 'is_bot': False, 'platform': platform},
+        {'business_id': business_id, 'text': bot_text, 'sender': "bot", 'customer_id': customer_id,
+         'customer_name': customer_name, 'is_bot': True, 'platform': platform},
+    ]
+    # Ids in row order: the history cache carries them so summaries can be anchored to messages
+    result = await db.execute(insert(Message).returning(Message.id, sort_by_parameter_order=True), rows)
+    ids = result.scalars().all()
+    await message_events.publish(db, business_id, customer_id)
+    await db.commit()
+
+    await session_cache.append_messages(
+        business_id,
+        customer_id if customer_id is not None else customer_name,
+        [{'id': msg_id, 'sender': row['sender'], 'text': row['text'], 'customer_name': customer_name,
+          'is_bot': row['is_bot']}
+         for msg_id, row in zip(ids, rows)],
+    )
+    if customer_id is not None:
+        await session_cache.clear_customers(business_id)
+    memory.schedule_indexing(business_id, customer_id)
+
+
 async def clear_conversation_history(db, business_id, customer_id=None, customer_name=None):
     """Delete all messages associated with a specific business and customer."""
     from sqlalchemy import and_, or_
@@ -362,5 +695,9 @@ async def clear_conversation_history(db, business_id, customer_id=None, customer
     results = await db.execute(
         delete(Message).where(and_(*filters))
     )
-    logger.info(f"{results.rowcount} messages were deleted for {customer_id or customer_name}")
+    logger.info("%s messages were deleted for %s", results.rowcount, customer_id or customer_name)
     await db.commit()
+
+    for session_id in {customer_id, customer_name} - {None}:
+        await session_cache.clear(business_id, session_id)
+    await session_cache.clear_customers(business_id)
@@ -0,0 +1,239 @@
+"""
+Redis-backed cache of recent conversation history.
+
+Keeps the tail of each customer's conversation so a chat turn doesn't have to
+re-query the messages table, and each business's conversation list for the
+conversations page. Redis is optional: on any Redis error the callers fall back
+to the database.
+"""
+import logging
+
+import orjson
+import redis.asyncio as redis
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+HISTORY_TTL_SECONDS = 60 * 60
+HISTORY_MAX_MESSAGES = 20
+SUMMARY_TTL_SECONDS = 7 * 24 * 60 * 60
+# The conversation list is dropped whenever a message is saved; the TTL only bounds missed invalidations
+CUSTOMERS_TTL_SECONDS = 60
+# Set of customer ids with AI replies turned off; shared by every worker, no expiry
+AI_DISABLED_KEY = "ai_disabled"
+
+_redis: redis.Redis | None = None
+
+
+def _get_redis() -> redis.Redis:
+    """Lazily create the shared Redis connection pool."""
+    global _redis
+    if _redis is None:
+        _redis = redis.from_url(
+            settings.redis_url,
+            password=settings.redis_password,
+            socket_connect_timeout=0.5,
+            socket_timeout=0.5,
+        )
+    return _redis
+
+
+def _key(business_id, customer_id) -> str:
+    return f"chat_history:{business_id}:{customer_id}"
+
+
+# ✅ Generation counters, bumped on every invalidation. A cache fill built from a database read only
+# lands if the counters are unchanged since before that read, so a fill racing a write can't store a
+# copy that is missing the write.
+def _history_generation_key(business_id, customer_id) -> str:
+    return f"chat_history_gen:{business_id}:{customer_id}"
+
+
+def _customers_generation_key(business_id) -> str:
+    return f"customers_gen:{business_id}"
+
+
+def _bump(pipe, key):
+    pipe.incr(key)
+    pipe.expire(key, HISTORY_TTL_SECONDS)
+
+
+async def _generation(*keys) -> tuple | None:
+    """Read generation counters before a database read; None when Redis is unavailable."""
+    try:
+        return tuple(await _get_redis().mget(keys))
+    except (redis.RedisError, OSError) as e:
+        logger.debug("History cache unavailable: %s", e)
+        return None
+
+
+async def _fill_if_unchanged(keys, generation, fill):
+    """Run fill(pipe) in a transaction only if the generation counters still read ``generation``."""
+    if generation is None:
+        return
+    try:
+        async with _get_redis().pipeline(transaction=True) as pipe:
+            await pipe.watch(*keys)
+            if tuple(await pipe.mget(keys)) != generation:
+                return
+            pipe.multi()
+            fill(pipe)
+            await pipe.execute()
+    except redis.WatchError:
+        logger.debug("Cache fill skipped: invalidated during the read")
+    except (redis.RedisError, OSError) as e:
+        logger.debug("History cache unavailable: %s", e)
+
+
+async def history_generation(business_id, customer_id) -> tuple | None:
+    """Read before loading history from the database; pass the result to set_messages."""
+    return await _generation(_history_generation_key(business_id, customer_id))
+
+
+async def get_messages(business_id, customer_id, limit=HISTORY_MAX_MESSAGES) -> list[dict] | None:
+    """Return the cached history tail, or None if it isn't cached (or Redis is unavailable)."""
+    if limit > HISTORY_MAX_MESSAGES:
+        return None
+    try:
+        raw = await _get_redis().lrange(_key(business_id, customer_id), -limit, -1)
+    except (redis.RedisError, OSError) as e:
+        logger.debug("History cache unavailable: %s", e)
+        return None
+    if not raw:
+        return None
+    return [orjson.loads(item) for item in raw]
+
+
+async def set_messages(business_id, customer_id, messages: list[dict], generation: tuple | None):
+    """
+    Replace the cached history with the given (oldest-first) messages, unless the history was
+    written to or cleared since ``generation`` was read.
+    """
+    if not messages:
+        return
+    key = _key(business_id, customer_id)
+
+    def fill(pipe):
+        pipe.delete(key)
+        pipe.rpush(key, *(orjson.dumps(msg) for msg in messages))
+        pipe.ltrim(key, -HISTORY_MAX_MESSAGES, -1)
+        pipe.expire(key, HISTORY_TTL_SECONDS)
+
+    await _fill_if_unchanged((_history_generation_key(business_id, customer_id),), generation, fill)
+
+
+async def append_message(business_id, customer_id, message: dict):
+    """Append a message to an already-cached history; a missing entry is left to be rebuilt from the DB."""
+    await append_messages(business_id, customer_id, [message])
+
+
+async def append_messages(business_id, customer_id, messages: list[dict]):
+    """Append several messages (oldest first) to an already-cached history in one round trip."""
+    key = _key(business_id, customer_id)
+    try:
+        async with _get_redis().pipeline(transaction=True) as pipe:
+            pipe.rpushx(key, *(orjson.dumps(msg) for msg in messages))
+            pipe.ltrim(key, -HISTORY_MAX_MESSAGES, -1)
+            pipe.expire(key, HISTORY_TTL_SECONDS)
+            _bump(pipe, _history_generation_key(business_id, customer_id))
+            await pipe.execute()
+    except (redis.RedisError, OSError) as e:
+        logger.debug("History cache unavailable: %s", e)
+
+
+async def clear(business_id, customer_id):
+    """Drop one customer's cached history and summary."""
+    try:
+        async with _get_redis().pipeline(transaction=True) as pipe:
+            pipe.delete(_key(business_id, customer_id), _summary_key(business_id, customer_id))
+            _bump(pipe, _history_generation_key(business_id, customer_id))
+            await pipe.execute()
+    except (redis.RedisError, OSError) as e:
+        logger.debug("History cache unavailable: %s", e)
+
+
+def _customers_key(business_id) -> str:
+    return f"customers:{business_id}"
+
+
+async def get_customers(business_id) -> list[dict] | None:
+    """Return the cached conversation list for a business, or None if it isn't cached."""
+    try:
+        raw = await _get_redis().get(_customers_key(business_id))
+    except (redis.RedisError, OSError) as e:
+        logger.debug("History cache unavailable: %s", e)
+        return None
+    return orjson.loads(raw) if raw is not None else None
+
+
+async def customers_generation(business_id) -> tuple | None:
+    """Read before loading the conversation list from the database; pass the result to set_customers."""
+    return await _generation(_customers_generation_key(business_id))
+
+
+async def set_customers(business_id, customers: list[dict], generation: tuple | None):
+    """Cache a business's conversation list, unless it was invalidated since ``generation`` was read."""
+    def fill(pipe):
+        pipe.set(_customers_key(business_id), orjson.dumps(customers), ex=CUSTOMERS_TTL_SECONDS)
+
+    await _fill_if_unchanged((_customers_generation_key(business_id),), generation, fill)
+
+
+async def clear_customers(business_id):
+    """Drop a business's cached conversation list (call after saving or deleting its messages)."""
+    try:
+        async with _get_redis().pipeline(transaction=True) as pipe:
+            pipe.delete(_customers_key(business_id))
+            _bump(pipe, _customers_generation_key(business_id))
+            await pipe.execute()
+    except (redis.RedisError, OSError) as e:
+        logger.debug("History cache unavailable: %s", e)
+
+
+async def get_ai_disabled() -> set[str] | None:
+    """Return the customers with AI replies turned off, or None if Redis is unavailable."""
+    try:
+        members = await _get_redis().smembers(AI_DISABLED_KEY)
+    except (redis.RedisError, OSError) as e:
+        logger.debug("History cache unavailable: %s", e)
+        return None
+    return {member.decode("utf-8") for member in members}
+
+
+async def set_ai_disabled(customer_id, disabled: bool):
+    """Turn AI replies off (or back on) for a customer across all workers."""
+    try:
+        client = _get_redis()
+        if disabled:
+            await client.sadd(AI_DISABLED_KEY, customer_id)
+        else:
+            await client.srem(AI_DISABLED_KEY, customer_id)
+    except (redis.RedisError, OSError) as e:
+        logger.debug("History cache unavailable: %s", e)
+
+
+def _summary_key(business_id, customer_id) -> str:
+    return f"chat_summary:{business_id}:{customer_id}"
+
+
+async def get_summary(business_id, customer_id) -> dict | None:
+    """
+    Return a conversation's running summary of older turns as {"summary", "through"} (the id of the
+    last message it covers), or None if there is none.
+    """
+    try:
+        raw = await _get_redis().get(_summary_key(business_id, customer_id))
+    except (redis.RedisError, OSError) as e:
+        logger.debug("History cache unavailable: %s", e)
+        return None
+    return orjson.loads(raw) if raw is not None else None
+
+
+async def set_summary(business_id, customer_id, summary: str, through: int):
+    """Store a conversation's running summary, covering every message up to id ``through``."""
+    try:
+        await _get_redis().set(_summary_key(business_id, customer_id),
+                               orjson.dumps({"summary": summary, "through": through}), ex=SUMMARY_TTL_SECONDS)
+    except (redis.RedisError, OSError) as e:
+        logger.debug("History cache unavailable: %s", e)
@@ -1,13 +1,17 @@
+import asyncio
 import logging
 import os
 
-import requests
+import httpx
+import orjson
+from cachetools import TTLCache
 from dotenv import load_dotenv
 from fastapi import Depends
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from ai.image_embeddings import generate_text_embedding, generate_image_embedding, generate_image_embedding_from_base64
+from ai.image_embeddings import generate_text_embedding_async, generate_image_embedding, \
+    generate_image_embedding_from_base64
 from database import get_db
 from models import Product
 
@@ -17,6 +21,32 @@ logger = logging.getLogger(__name__)
 
 VAULTA_BASE_URL = os.getenv("VAULTA_BASE_URL")
 VAULTA_API_KEY = os.getenv("VAULTA_API_KEY")
+
+# ✅ Shared async connection pool for the HTTP tools, so concurrent tool calls overlap on the event loop
+# and reuse warm TLS connections. Transport retries cover connection failures only.
+HTTP_TIMEOUT = 10
+_http: httpx.AsyncClient | None = None
+
+
+def _get_http() -> httpx.AsyncClient:
+    """Lazily create the shared HTTP client (it must be created inside the running event loop)."""
+    global _http
+    if _http is None:
+        _http = httpx.AsyncClient(
+            timeout=HTTP_TIMEOUT,
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+            transport=httpx.AsyncHTTPTransport(retries=2),
+            headers={"User-Agent": "OmniLabsGhana-Tools/1.0"},
+        )
+    return _http
+
+
+async def close_http_client():
+    """Close the shared HTTP client. This should be called at application shutdown."""
+    global _http
+    if _http is not None:
+        await _http.aclose()
+        _http = None
 tools = [
     {
         "type": "function",
@@ -218,8 +248,38 @@ tools = [
 ]
 
 
-def get_weather(latitude: float, longitude: float):
-    """Get the current weather for a specific geographic location."""
+# ✅ Columns the product tools return; selecting only these keeps the embedding vector (the bulk of
+# each row) on the database side and skips ORM hydration
+PRODUCT_COLUMNS = (Product.id, Product.name, Product.description, Product.price, Product.image_url)
+
+
+# ✅ Short-lived caches for idempotent upstream lookups (only touched from the event loop)
+# Current conditions move on a ~15 minute scale; the FX API publishes daily rates
+_weather_cache = TTLCache(maxsize=1024, ttl=900)
+_exchange_rate_cache = TTLCache(maxsize=1024, ttl=3600)
+# Product listings and searches, keyed (business_id, ...); product routes invalidate on write
+_products_cache = TTLCache(maxsize=2048, ttl=30)
+
+
+async def _cached_call(cache, key, fetch):
+    """Return a cached result for key, or fetch and cache it. Errors are never cached."""
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+
+    result = await fetch()
+    if not (isinstance(result, dict) and "error" in result):
+        cache[key] = result
+    return result
+
+
+def invalidate_product_cache(business_id):
+    """Drop cached product listings and searches for a business (call after a product write)."""
+    for key in [key for key in _products_cache.keys() if key[0] == business_id]:
+        _products_cache.pop(key, None)
+
+
+async def _fetch_weather(latitude: float, longitude: float):
     try:
         url = (
             "https://api.open-meteo.com/v1/forecast"
@@ -227,24 +287,30 @@ def get_weather(latitude: float, longitude: float):
             "&current=temperature_2m,wind_speed_10m"
         )
 
-        response = requests.get(url, timeout=10)
+        response = await _get_http().get(url)
         response.raise_for_status()
 
-        data = response.json()
+        data = orjson.loads(response.content)
         return data.get("current", {})
 
     except Exception as e:
         return {"error": str(e)}
 
 
-def get_exchange_rate(local_currency, foreign_currency):
-    "Get the exchange rate for a specific currency pair"
+async def get_weather(latitude: float, longitude: float):
+    """Get the current weather for a specific geographic location."""
+    # ~1 km grid: nearby requests for the same city share a cache entry
+    key = (round(float(latitude), 2), round(float(longitude), 2))
+    return await _cached_call(_weather_cache, key, lambda: _fetch_weather(*key))
+
+
+async def _fetch_exchange_rate(local_currency, foreign_currency):
     try:
-        response = requests.get(
+        response = await _get_http().get(
             f"https://api.exchangerate-api.com/v4/latest/{local_currency}"
         )
         response.raise_for_status()
-        data = response.json()
+        data = orjson.loads(response.content)
         exchange_rate = data['rates'][foreign_currency]
         return {
             "local_currency": local_currency,
@@ -256,6 +322,12 @@ def get_exchange_rate(local_currency, foreign_currency):
         return {"error": str(e)}
 
 
+async def get_exchange_rate(local_currency, foreign_currency):
+    "Get the exchange rate for a specific currency pair"
+    key = (str(local_currency).strip().upper(), str(foreign_currency).strip().upper())
+    return await _cached_call(_exchange_rate_cache, key, lambda: _fetch_exchange_rate(*key))
+
+
 async def get_products(db: AsyncSession= Depends(get_db), business_id: int = None):
     """
     Get the list of products for a business.
@@ -264,25 +336,17 @@ async def get_products(db: AsyncSession= Depends(get_db), business_id: int = Non
         if not business_id:
             return {"error": "Business ID is required"}
 
-        result = await db.execute(select(Product).where(Product.business_id == business_id))
-        products = result.scalars().all()
-
-        product_list = []
-        for p in products:
-            product_list.append({
-                "id": p.id,
-                "name": p.name,
-                "description": p.description,
-                "price": p.price,
-                "image_url": p.image_url
-            })
-
-        return product_list
+        return await _cached_call(_products_cache, (business_id,), lambda: _fetch_products(db, business_id))
     except Exception as e:
         return {"error": str(e)}
 
 
-def get_rate(pair, side, amount_crypto, amount_fiat):
+async def _fetch_products(db: AsyncSession, business_id: int):
+    result = await db.execute(select(*PRODUCT_COLUMNS).where(Product.business_id == business_id))
+    return [dict(row) for row in result.mappings().all()]
+
+
+async def get_rate(pair, side, amount_crypto, amount_fiat):
     quotes_url = f"{VAULTA_BASE_URL}/get_quote"
     headers = {
         "x-api-key": VAULTA_API_KEY,
@@ -297,11 +361,10 @@ def get_rate(pair, side, amount_crypto, amount_fiat):
     }
 
     try:
-        response = requests.post(quotes_url, headers=headers, json=payload)
+        response = await _get_http().post(quotes_url, headers=headers, json=payload)
         response.raise_for_status()
-        quote = response.json()
-        print("Quote created successfully:")
-        print(quote)
+        quote = orjson.loads(response.content)
+        logger.debug("Quote created successfully: %s", quote)
         return quote
     except Exception as e:
         return {"error": str(e)}
@@ -315,42 +378,39 @@ async def search_similar_products(query: str, limit: int = 5, db: AsyncSession =
         if not db or not business_id:
             return {"error": "Database session and business ID required"}
 
-        # Generate embedding from query text
-        try:
-            query_embedding = generate_text_embedding(query)
-        except Exception as e:
-            logger.warning(f"Vector search warning (embedding failed): {e}")
-            return {"error": f"Failed to generate text embedding: {str(e)}"}
+        # Repeated searches ("red sneakers" vs "Red  sneakers") skip both the embedding call and the query
+        key = (business_id, " ".join(str(query).lower().split()), limit or 5)
+        return await _cached_call(_products_cache, key, lambda: _search_similar_products(query, key[2], db, business_id))
+    except Exception as e:
+        logger.warning(f"Vector search warning (search_similar_products): {e}")
+        return {"error": str(e)}
 
-        # Query using pgvector cosine distance
-        result = await db.execute(
-            select(Product)
-            .where(
-                Product.business_id == business_id,
-                Product.image_embedding.isnot(None)
-            )
-            .order_by(Product.image_embedding.cosine_distance(query_embedding))
-            .limit(limit or 5)
+
+async def _search_similar_products(query: str, limit: int, db: AsyncSession, business_id: int):
+    # Generate embedding from query text
+    try:
+        query_embedding = await generate_text_embedding_async(query)
+    except Exception as e:
+        logger.warning(f"Vector search warning (embedding failed): {e}")
+        return {"error": f"Failed to generate text embedding: {str(e)}"}
+
+    # Query using pgvector cosine distance
+    result = await db.execute(
+        select(*PRODUCT_COLUMNS)
+        .where(
+            Product.business_id == business_id,
+            Product.image_embedding.isnot(None)
         )
+        .order_by(Product.image_embedding.cosine_distance(query_embedding))
+        .limit(limit)
+    )
 
-        products = result.scalars().all()
+    products = result.mappings().all()
 
-        if not products:
-            return {"message": "No products with image embeddings found. Try uploading product images first."}
+    if not products:
+        return {"message": "No products with image embeddings found. Try uploading product images first."}
 
-        return [
-            {
-                "id": p.id,
-                "name": p.name,
-                "description": p.description,
-                "price": p.price,
-                "image_url": p.image_url
-            }
-            for p in products
-        ]
-    except Exception as e:
-        logger.warning(f"Vector search warning (search_similar_products): {e}")
-        return {"error": str(e)}
+    return [dict(row) for row in products]
 
 
 async def search_by_image(image_url: str = None, image_data: str = None,
@@ -362,11 +422,11 @@ async def search_by_image(image_url: str = None, image_data: str = None,
         try:
             if image_data:
                 # Use base64 data directly — no network call needed
-                print("Generating image embedding from base64 data...")
-                query_embedding = generate_image_embedding_from_base64(image_data)
+                logger.debug("Generating image embedding from base64 data...")
+                query_embedding = await asyncio.to_thread(generate_image_embedding_from_base64, image_data)
             elif image_url:
-                print(f"Generating image embedding for URL: {image_url}")
-                query_embedding = generate_image_embedding(image_url)
+                logger.debug("Generating image embedding for URL: %s", image_url)
+                query_embedding = await asyncio.to_thread(generate_image_embedding, image_url)
             else:
                 return {"error": "Either image_url or image_data is required"}
         except Exception as e:
@@ -375,9 +435,9 @@ async def search_by_image(image_url: str = None, image_data: str = None,
         # ... rest unchanged
 
         # Query using pgvector cosine distance
-        print(f"Searching for similar products in business {business_id}...")
+        logger.debug("Searching for similar products in business %s...", business_id)
         result = await db.execute(
-            select(Product)
+            select(*PRODUCT_COLUMNS)
             .where(
                 Product.business_id == business_id,
                 Product.image_embedding.isnot(None)
@@ -386,22 +446,13 @@ async def search_by_image(image_url: str = None, image_data: str = None,
             .limit(limit or 5)
         )
 
-        results = result.scalars().all()
+        results = result.mappings().all()
 
         if not results:
             return {"message": "No products with image embeddings found. Try uploading product images first."}
 
-        print(f"Found {len(results)} similar products.")
-        return [
-            {
-                "id": p.id,
-                "name": p.name,
-                "description": p.description,
-                "price": p.price,
-                "image_url": p.image_url
-            }
-            for p in results
-        ]
+        logger.debug("Found %d similar products.", len(results))
+        return [dict(row) for row in results]
     except Exception as e:
         return {"error": str(e)}
 
@@ -416,20 +467,20 @@ async def get_total(product_name: str, quantity: int, db: AsyncSession, business
 
         # Search for the product by name (case-insensitive)
         result = await db.execute(
-            select(Product).where(
+            select(Product.price).where(
                 Product.business_id == business_id,
                 Product.name.ilike(f"%{product_name}%")
-            )
+            ).limit(1)
         )
-        product = result.scalars().first()
+        price = result.scalars().first()
 
         # Fallback: If strict text match fails, try vector similarity
-        if not product:
+        if price is None:
             try:
                 # Generate embedding for the product name to find semantic match
-                query_embedding = generate_text_embedding(product_name)
+                query_embedding = await generate_text_embedding_async(product_name)
                 result = await db.execute(
-                    select(Product)
+                    select(Product.price)
                     .where(
                         Product.business_id == business_id,
                         Product.image_embedding.isnot(None)
@@ -437,14 +488,14 @@ async def get_total(product_name: str, quantity: int, db: AsyncSession, business
                     .order_by(Product.image_embedding.cosine_distance(query_embedding))
                     .limit(1)
                 )
-                product = result.scalars().first()
+                price = result.scalars().first()
             except Exception as e:
                 logger.warning(f"Vector fallback in get_total failed: {e}")
 
-        if not product:
+        if price is None:
             return {"error": f"Product '{product_name}' not found."}
 
-        total_amount = product.price * quantity
+        total_amount = price * quantity
 
         return {
             "total_amount": total_amount,
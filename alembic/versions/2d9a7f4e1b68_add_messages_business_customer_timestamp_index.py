@@ -0,0 +1,34 @@
+"""Add composite index on messages business_id, customer_id and timestamp
+
+Revision ID: 2d9a7f4e1b68
+Revises: 8f31d6a2c7e4
+Create Date: 2026-10-16 11:24:41.208315
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '2d9a7f4e1b68'
+down_revision: Union[str, Sequence[str], None] = '8f31d6a2c7e4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Built concurrently so writes to messages aren't blocked for the length of the build
+    with op.get_context().autocommit_block():
+        op.create_index('ix_messages_business_customer_timestamp', 'messages',
+                        ['business_id', 'customer_id', 'timestamp', 'id'], unique=False,
+                        postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_messages_business_customer_timestamp', table_name='messages',
+                      postgresql_concurrently=True)
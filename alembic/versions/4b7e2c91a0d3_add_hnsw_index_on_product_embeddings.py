@@ -0,0 +1,30 @@
+"""Add HNSW index on product image embeddings
+
+Revision ID: 4b7e2c91a0d3
+Revises: dc5211b04f0a
+Create Date: 2026-10-16 09:12:40.118204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4b7e2c91a0d3'
+down_revision: Union[str, Sequence[str], None] = 'dc5211b04f0a'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index(op.f('ix_products_image_embedding'), 'products', ['image_embedding'], unique=False,
+                    postgresql_using='hnsw', postgresql_ops={'image_embedding': 'vector_cosine_ops'})
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_products_image_embedding'), table_name='products',
+                  postgresql_using='hnsw', postgresql_ops={'image_embedding': 'vector_cosine_ops'})
@@ -0,0 +1,36 @@
+"""Make the product image embedding HNSW index partial on non-null embeddings
+
+Revision ID: 7c4e1a9b3f25
+Revises: 2d9a7f4e1b68
+Create Date: 2026-10-16 13:05:17.530962
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7c4e1a9b3f25'
+down_revision: Union[str, Sequence[str], None] = '2d9a7f4e1b68'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.drop_index(op.f('ix_products_image_embedding'), table_name='products',
+                  postgresql_using='hnsw', postgresql_ops={'image_embedding': 'vector_cosine_ops'})
+    op.create_index(op.f('ix_products_image_embedding'), 'products', ['image_embedding'], unique=False,
+                    postgresql_using='hnsw', postgresql_ops={'image_embedding': 'vector_cosine_ops'},
+                    postgresql_where=sa.text('image_embedding IS NOT NULL'))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_products_image_embedding'), table_name='products',
+                  postgresql_using='hnsw', postgresql_ops={'image_embedding': 'vector_cosine_ops'},
+                  postgresql_where=sa.text('image_embedding IS NOT NULL'))
+    op.create_index(op.f('ix_products_image_embedding'), 'products', ['image_embedding'], unique=False,
+                    postgresql_using='hnsw', postgresql_ops={'image_embedding': 'vector_cosine_ops'})
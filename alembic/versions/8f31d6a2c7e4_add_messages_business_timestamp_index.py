@@ -0,0 +1,32 @@
+"""Add composite index on messages business_id and timestamp
+
+Revision ID: 8f31d6a2c7e4
+Revises: 4b7e2c91a0d3
+Create Date: 2026-10-16 10:03:17.552091
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8f31d6a2c7e4'
+down_revision: Union[str, Sequence[str], None] = '4b7e2c91a0d3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Built concurrently so writes to messages aren't blocked for the length of the build
+    with op.get_context().autocommit_block():
+        op.create_index('ix_messages_business_id_timestamp', 'messages', ['business_id', 'timestamp'], unique=False,
+                        postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_messages_business_id_timestamp', table_name='messages', postgresql_concurrently=True)
@@ -0,0 +1,29 @@
+"""Add text embeddings to messages for conversation memory recall
+
+Revision ID: a5f2c8e1d937
+Revises: e3b8d0c6a714
+Create Date: 2026-10-16 16:20:33.184520
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from pgvector.sqlalchemy import Vector
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a5f2c8e1d937'
+down_revision: Union[str, Sequence[str], None] = 'e3b8d0c6a714'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('messages', sa.Column('embedding', Vector(1408), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('messages', 'embedding')
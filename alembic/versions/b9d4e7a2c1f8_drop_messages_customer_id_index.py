@@ -0,0 +1,33 @@
+"""Drop single-column index on messages customer_id
+
+Revision ID: b9d4e7a2c1f8
+Revises: a5f2c8e1d937
+Create Date: 2026-10-16 17:05:31.284617
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b9d4e7a2c1f8'
+down_revision: Union[str, Sequence[str], None] = 'a5f2c8e1d937'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Every customer lookup also filters on business_id, which ix_messages_business_customer_timestamp
+    # serves; the standalone index only added write cost to each message insert
+    with op.get_context().autocommit_block():
+        op.drop_index(op.f('ix_messages_customer_id'), table_name='messages', postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.create_index(op.f('ix_messages_customer_id'), 'messages', ['customer_id'], unique=False,
+                        postgresql_concurrently=True)
@@ -0,0 +1,50 @@
+"""Store product image embeddings as halfvec
+
+Revision ID: c3e8f1a6d2b4
+Revises: b9d4e7a2c1f8
+Create Date: 2026-10-16 17:48:12.905163
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from pgvector.sqlalchemy import HALFVEC, Vector
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c3e8f1a6d2b4'
+down_revision: Union[str, Sequence[str], None] = 'b9d4e7a2c1f8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # The index's operator class is tied to the column type, so it is rebuilt around the cast
+    op.drop_index(op.f('ix_products_image_embedding'), table_name='products',
+                  postgresql_using='hnsw', postgresql_ops={'image_embedding': 'vector_cosine_ops'},
+                  postgresql_where=sa.text('image_embedding IS NOT NULL'))
+    op.alter_column('products', 'image_embedding',
+                    existing_type=Vector(1408),
+                    type_=HALFVEC(1408),
+                    existing_nullable=True,
+                    postgresql_using='image_embedding::halfvec(1408)')
+    op.create_index(op.f('ix_products_image_embedding'), 'products', ['image_embedding'], unique=False,
+                    postgresql_using='hnsw', postgresql_ops={'image_embedding': 'halfvec_cosine_ops'},
+                    postgresql_where=sa.text('image_embedding IS NOT NULL'))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_products_image_embedding'), table_name='products',
+                  postgresql_using='hnsw', postgresql_ops={'image_embedding': 'halfvec_cosine_ops'},
+                  postgresql_where=sa.text('image_embedding IS NOT NULL'))
+    op.alter_column('products', 'image_embedding',
+                    existing_type=HALFVEC(1408),
+                    type_=Vector(1408),
+                    existing_nullable=True,
+                    postgresql_using='image_embedding::vector(1408)')
+    op.create_index(op.f('ix_products_image_embedding'), 'products', ['image_embedding'], unique=False,
+                    postgresql_using='hnsw', postgresql_ops={'image_embedding': 'vector_cosine_ops'},
+                    postgresql_where=sa.text('image_embedding IS NOT NULL'))
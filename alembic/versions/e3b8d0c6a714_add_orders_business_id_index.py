@@ -0,0 +1,32 @@
+"""Add index on orders business_id
+
+Revision ID: e3b8d0c6a714
+Revises: 7c4e1a9b3f25
+Create Date: 2026-10-16 15:42:09.671384
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e3b8d0c6a714'
+down_revision: Union[str, Sequence[str], None] = '7c4e1a9b3f25'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # CONCURRENTLY can't run inside a transaction; it avoids locking orders against writes
+    with op.get_context().autocommit_block():
+        op.create_index(op.f('ix_orders_business_id'), 'orders', ['business_id'], unique=False,
+                        postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index(op.f('ix_orders_business_id'), table_name='orders', postgresql_concurrently=True)
@@ -1,24 +1,41 @@
 from datetime import UTC, datetime, timedelta
 
 import jwt
+from argon2 import PasswordHasher
+from argon2.exceptions import InvalidHashError, VerificationError
 from fastapi import Depends, FastAPI, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Mapped
-from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.security import check_password_hash
 from config import settings
-from database import get_db
+from database import get_db, jwt_codec, JWT_SECRET, JWT_ALGORITHMS, JWT_DECODE_OPTIONS
 from models import User
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/users/token")
 
+# argon2id tuned for tens of ms per login; legacy werkzeug hashes are still accepted
+password_hasher = PasswordHasher(time_cost=2, memory_cost=65536, parallelism=2)
+
 
 def hash_password(password: str) -> str:
-    return generate_password_hash(password)
+    return password_hasher.hash(password)
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return check_password_hash(hashed_password, plain_password)
+    if not hashed_password.startswith("$argon2"):
+        return check_password_hash(hashed_password, plain_password)
+    try:
+        return password_hasher.verify(hashed_password, plain_password)
+    except (VerificationError, InvalidHashError):
+        return False
+
+
+def password_needs_rehash(hashed_password: str) -> bool:
+    """True for legacy werkzeug hashes or argon2 hashes with outdated parameters."""
+    if not hashed_password.startswith("$argon2"):
+        return True
+    return password_hasher.check_needs_rehash(hashed_password)
 
 
 def create_access_token(data: dict, expires_delta: timedelta | None = None) -> str:
@@ -31,23 +48,14 @@ def create_access_token(data: dict, expires_delta: timedelta | None = None) -> s
             minutes=settings.access_token_expire_minutes,
         )
     to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(
-        to_encode,
-        settings.secret_key.get_secret_value(),
-        algorithm=settings.algorithm,
-    )
+    encoded_jwt = jwt_codec.encode(to_encode, JWT_SECRET, algorithm=settings.algorithm)
     return encoded_jwt
 
 
 def verify_access_token(token: str) -> str | None:
     """Verify a JWT access token and return the subject (user id) if valid."""
     try:
-        payload = jwt.decode(
-            token,
-            settings.secret_key.get_secret_value(),
-            algorithms=[settings.algorithm],
-            options={"require": ["exp", "sub"]},
-        )
+        payload = jwt_codec.decode(token, JWT_SECRET, algorithms=JWT_ALGORITHMS, options=JWT_DECODE_OPTIONS)
     except jwt.InvalidTokenError:
         return None
     else:
@@ -25,6 +25,7 @@ class Settings(BaseSettings):
     environment: str = "development"  # development / staging / production
     debug: bool = True
     app_name: str = "OmniLabsGhana API"
+    strict_loading: bool = True  # raise on lazy relationship loads in list queries (STRICT_LOADING=0 to disable)
 
     # -----------------------------
     # Auth / Security
@@ -39,6 +40,11 @@ class Settings(BaseSettings):
     database_url: str = ""
     supabase_url: str | None = None
     supabase_key: str | None = None
+    db_pool_size: int = 20
+    db_max_overflow: int = 40
+    db_pool_recycle: int = 1800  # seconds; recycle before server/proxy idle timeouts drop the connection
+    db_pool_timeout: int = 30  # seconds to wait for a free connection before failing the request
+    hnsw_ef_search: int = 100
 
     # -----------------------------
     # Redis
@@ -52,6 +58,8 @@ class Settings(BaseSettings):
     gcp_project_id: str | None = None
     gcp_location: str = "europe-west1"
     gcp_credentials_path: str | None = None
+    embedding_cache_dir: str = "embeddings_cache"
+    conversation_memory_enabled: bool = False  # embeds every saved message (one Vertex AI call per turn)
 
     # -----------------------------
     # Email / SMTP
@@ -1,13 +1,18 @@
+import hashlib
 import os
+import time
+from dataclasses import dataclass
 
 import jwt
+from cachetools import TTLCache
 from dotenv import load_dotenv
 from fastapi import Depends, status, Request
 from fastapi.exceptions import HTTPException
 from fastapi.security import OAuth2PasswordBearer
+from sqlalchemy import bindparam
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy.orm import DeclarativeBase, selectinload
+from sqlalchemy.orm import DeclarativeBase, raiseload
 
 from config import settings
 from models import User, Business
@@ -27,16 +32,37 @@ if not SQLALCHEMY_DATABASE_URL:
     SQLALCHEMY_DATABASE_URL = "sqlite+aiosqlite:///./chatbot.db"
 
 connect_args = {}
+engine_options = {}
 if "sqlite" in SQLALCHEMY_DATABASE_URL:
     connect_args = {"check_same_thread": False}
+else:
+    # Reuse warm connections across requests instead of paying TCP/TLS setup per query
+    engine_options = {
+        "pool_size": settings.db_pool_size,
+        "max_overflow": settings.db_max_overflow,
+        "pool_recycle": settings.db_pool_recycle,
+        "pool_timeout": settings.db_pool_timeout,
+        "pool_pre_ping": True,
+        # LIFO: reuse the most recently returned (warm) connection; idle extras age out via pool_recycle
+        "pool_use_lifo": True,
+    }
+    # ✅ HNSW candidate list size for similarity search. Results are filtered by business after the
+    # index scan, so a larger list keeps LIMIT k filled for businesses with a small share of products.
+    # JIT compilation only adds planning overhead to these short OLTP queries.
+    connect_args = {"server_settings": {"hnsw.ef_search": str(settings.hnsw_ef_search), "jit": "off"}}
 
 engine = create_async_engine(
     SQLALCHEMY_DATABASE_URL,
-    connect_args=connect_args
+    connect_args=connect_args,
+    **engine_options
 )
 
 AsyncSessionLocal = async_sessionmaker(autocommit=False, autoflush=False, bind=engine, expire_on_commit=False)
 
+# ✅ Loader options for queries that return lists of entities: with strict loading, touching a relationship
+# that wasn't loaded explicitly raises instead of quietly issuing one query per row
+LIST_LOAD_OPTIONS = (raiseload("*"),) if settings.strict_loading else ()
+
 
 async def get_db():
     async with AsyncSessionLocal() as session:
@@ -49,24 +75,74 @@ class Base(DeclarativeBase):
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/v1/login")
 
+# ✅ Authenticated users (with their business) kept briefly between requests, so repeat requests skip
+# the user lookup. Entries are detached snapshots, never ORM instances, so nothing is shared between
+# sessions. Invalidation only reaches the worker that made a change, so the TTL is kept short.
+_user_cache = TTLCache(maxsize=10_000, ttl=5)
+
+
+@dataclass(frozen=True, slots=True)
+class CurrentBusiness:
+    """Read-only view of the signed-in user's business; write changes with an UPDATE statement."""
+    id: int
+    name: str
+    phone_number_id: str | None
+    persona: str | None
+
+
+@dataclass(frozen=True, slots=True)
+class CurrentUser:
+    """Read-only view of the signed-in user, as returned by get_current_user."""
+    id: int
+    username: str
+    email: str | None
+    business: CurrentBusiness | None
+
+# ✅ JWT settings resolved once at import; token checks run on every authenticated request
+jwt_codec = jwt.PyJWT()
+JWT_SECRET = settings.secret_key.get_secret_value()
+JWT_ALGORITHMS = [settings.algorithm]
+JWT_DECODE_OPTIONS = {"require": ["exp", "sub"]}
+
+
+# ✅ Verified tokens → (user_id, exp), so repeat requests skip signature verification. Keyed by the
+# token's digest; invalid tokens are never cached and hits are re-checked against the token's expiry.
+_token_cache = TTLCache(maxsize=10_000, ttl=30)
+
 
 def decode_token_and_get_user_id(token: str) -> int | None:
+    key = hashlib.sha256(token.encode("utf-8")).digest()
+    cached = _token_cache.get(key)
+    if cached is not None:
+        user_id, exp = cached
+        if exp > time.time():
+            return user_id
+        _token_cache.pop(key, None)
+        return None
+
     try:
-        payload = jwt.decode(
-            token,
-            settings.secret_key.get_secret_value(),
-            algorithms=[settings.algorithm],
-            options={"require": ["exp", "sub"]},
-        )
-        return int(payload.get("sub"))
-    except jwt.InvalidTokenError:
+        payload = jwt_codec.decode(token, JWT_SECRET, algorithms=JWT_ALGORITHMS, options=JWT_DECODE_OPTIONS)
+        user_id = int(payload.get("sub"))
+    except (jwt.InvalidTokenError, ValueError):
         return None
 
+    _token_cache[key] = (user_id, payload["exp"])
+    return user_id
+
+
+# The user's single business comes back in the same round trip. Built once at import.
+_USER_WITH_BUSINESS_STMT = (
+    select(User.id, User.username, User.email,
+           Business.id.label("business_id"), Business.name, Business.phone_number_id, Business.persona)
+    .outerjoin(Business, Business.user_id == User.id)
+    .where(User.id == bindparam("user_id"))
+)
+
 
 async def get_current_user(
         request: Request,
         db: AsyncSession = Depends(get_db)
-) -> User:
+) -> CurrentUser:
     # Read JWT from cookie
     token = request.cookies.get("access_token")
     if not token:
@@ -84,28 +160,45 @@ async def get_current_user(
             detail="Invalid or expired token"
         )
 
+    # ✅ Recently seen users are served without a query
+    cached_user = _user_cache.get(user_id)
+    if cached_user is not None:
+        return cached_user
+
     # Fetch user
-    result = await db.execute(
-        select(User).options(selectinload(User.business)).where(User.id == int(user_id))
-    )
-    user = result.scalars().first()
-    if not user:
+    result = await db.execute(_USER_WITH_BUSINESS_STMT, {"user_id": user_id})
+    row = result.first()
+    if not row:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="User not found"
         )
 
+    business = None
+    if row.business_id is not None:
+        business = CurrentBusiness(id=row.business_id, name=row.name, phone_number_id=row.phone_number_id,
+                                   persona=row.persona)
+    user = CurrentUser(id=row.id, username=row.username, email=row.email, business=business)
+    _user_cache[user_id] = user
     return user
 
 
+def invalidate_user_cache(user_id: int):
+    """Drop a cached user (and business); call after changing either."""
+    _user_cache.pop(user_id, None)
+
+
+def forget_token(token: str | None):
+    """Drop a token and its user from the auth caches (call on logout)."""
+    if not token:
+        return
+    cached = _token_cache.pop(hashlib.sha256(token.encode("utf-8")).digest(), None)
+    if cached is not None:
+        invalidate_user_cache(cached[0])
+
+
 async def get_current_business(
         db: AsyncSession = Depends(get_db), current_user=Depends(get_current_user)
-) -> Business:
-    result = await db.execute(
-        select(Business)
-        .options(selectinload(Business.user))
-        .where(Business.user_id == current_user.id
-               ))
-    business = result.scalars().first()
-
-    return business
+) -> CurrentBusiness | None:
+    # The business is eager-loaded with the user in get_current_user, so no extra query is needed
+    return current_user.business
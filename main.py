@@ -1,29 +1,41 @@
 # Import necessary libraries and modules
+import dataclasses
+import logging
 import os
 from contextlib import asynccontextmanager
 from typing import Annotated
 
+import jinja2
 from fastapi import FastAPI, Request, status, Depends, Form
+from fastapi.concurrency import run_in_threadpool
 from fastapi.encoders import jsonable_encoder
 from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, RedirectResponse
+from fastapi.responses import JSONResponse, ORJSONResponse, RedirectResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from sqlalchemy import select, func
+from sqlalchemy import select, func, or_, update
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import selectinload
 from starlette.exceptions import HTTPException as StarletteHTTPException
 from uvicorn.middleware.proxy_headers import ProxyHeadersMiddleware
-from werkzeug.security import generate_password_hash, check_password_hash
 
-from ai.run_ai import get_ai_response, update_conversation_history, get_conversation_history, startup_ai_client
-from auth import create_access_token
-from database import get_db, engine, get_current_user, get_current_business
+from ai.image_embeddings import warmup as warmup_embeddings
+from ai.response_cache import clear_response_cache
+from ai.tools import close_http_client as close_tools_http_client
+from ai.run_ai import get_ai_response, update_conversation_history_pair, get_conversation_history, \
+    startup_ai_client, shutdown_ai_client, invalidate_persona, drain_background_writes
+from auth import create_access_token, hash_password, verify_password, password_needs_rehash
+from config import settings
+from database import get_db, engine, get_current_user, get_current_business, invalidate_user_cache, \
+    forget_token, LIST_LOAD_OPTIONS, CurrentUser
+import message_events
 from models import Business, User, Base, Product, Message, Mailinglist, Order
 from payment.payment import router as payment_router
 from routers import products, users, conversations, chat
 from whatsapp_bot.app import router as whatsapp_router, configure_logging
+from whatsapp_bot.app.utils.whatsapp_utils import forget_phone_number
+
+logger = logging.getLogger(__name__)
 
 
 # Define the application lifespan
@@ -37,13 +49,20 @@ async def lifespan(_app: FastAPI):
         await conn.run_sync(Base.metadata.create_all)  # Create database tables
         configure_logging()  # Configure logging for the WhatsApp bot
         startup_ai_client()
+        warmup_embeddings()
+    await message_events.start_listener()
     yield
     # Shutdown
+    await message_events.stop_listener()
+    await shutdown_ai_client()
+    await close_tools_http_client()
+    await drain_background_writes()
     await engine.dispose()
 
 
 # Initialize the FastAPI application
-app = FastAPI(lifespan=lifespan)
+# ✅ Serialize JSON route responses with orjson
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
 
 # Middleware to handle proxy headers for HTTPS
 app.add_middleware(ProxyHeadersMiddleware, trusted_hosts="*")
@@ -70,15 +89,40 @@ media_dir = os.path.join(current_dir, "media")
 os.makedirs(os.path.join(media_dir, "product_pics"), exist_ok=True)
 os.makedirs(os.path.join(media_dir, "products"), exist_ok=True)
 
+
+class CachedStaticFiles(StaticFiles):
+    """StaticFiles that sends a Cache-Control header, so browsers and CDNs stop re-requesting assets."""
+
+    def __init__(self, *args, cache_control: str, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cache_control = cache_control
+
+    def file_response(self, *args, **kwargs):
+        response = super().file_response(*args, **kwargs)
+        response.headers.setdefault("Cache-Control", self.cache_control)
+        return response
+
+
 # Mount static and media directories
-app.mount("/static", StaticFiles(directory=static_dir), name="static")
-app.mount("/media", StaticFiles(directory=media_dir), name="media")
+# ✅ Static assets keep their names across deploys, so they are revalidated (ETag) after a day; product
+# media files get a fresh uuid name on every upload and never change, so they can be cached for good
+app.mount("/static", CachedStaticFiles(directory=static_dir, cache_control="public, max-age=86400"),
+          name="static")
+app.mount("/media", CachedStaticFiles(directory=media_dir, cache_control="public, max-age=31536000, immutable"),
+          name="media")
 
-# Print application loading message
-print("--- Loading main.py application ---")
+# Log application loading message
+logger.info("--- Loading main.py application ---")
 
 # Initialize Jinja2 templates
-templates = Jinja2Templates(directory="templates")
+# ✅ One environment with a bytecode cache, so worker boots skip recompiling templates; outside debug
+# the templates are treated as immutable and not re-stat'ed on every render
+templates = Jinja2Templates(env=jinja2.Environment(
+    loader=jinja2.FileSystemLoader(os.path.join(current_dir, "templates")),
+    autoescape=True,
+    auto_reload=settings.debug,
+    bytecode_cache=jinja2.FileSystemBytecodeCache(),
+))
 
 # Include routers for different modules
 app.include_router(users.router, prefix="/api/users", tags=["users"])
@@ -93,46 +137,26 @@ app.include_router(conversations.router)
 # Define routes and their handlers
 @app.get("/chat", include_in_schema=False, name="home")
 async def chat_page(request: Request, db: AsyncSession = Depends(get_db),
-                    current_user: User = Depends(get_current_user)):
+                    current_user: CurrentUser = Depends(get_current_user)):
     """
     Render the chat page for the current user.
 
     Args:
         request (Request): The HTTP request object.
         db (Session): The database session.
-        current_user (User): The currently authenticated user.
+        current_user (CurrentUser): The currently authenticated user.
 
     Returns:
         TemplateResponse: The rendered chat page.
     """
-    result = await db.execute(
-        select(Business)
-        .options(selectinload(Business.user))
-        .where(Business.user_id == current_user.id)
-    )
-
-    business = result.scalars().first()
+    business = current_user.business
     if not business:
         response = RedirectResponse(url="/logout", status_code=303)
         response.set_cookie("error", "No business found for this account.")
         return response
 
-    # Fetch chat history
-    result = await db.execute(
-        select(Message)
-        .where(
-            Message.business_id == business.id,
-            Message.platform == "web",
-            Message.customer_id == current_user.username
-        )
-        .order_by(Message.timestamp.asc())
-    )
-    db_messages = result.scalars().all()
-
-    messages = [{"role": "user" if not msg.is_bot else "assistant", "content": msg.text,
-                 "timestamp": msg.timestamp.strftime("%H:%M") if msg.timestamp else ""} for msg in db_messages]
-
-    return templates.TemplateResponse("chat.html", {"request": request, "business": business, "messages": messages})
+    # chat.html renders the conversation client-side, so no history is loaded for the page itself
+    return templates.TemplateResponse("chat.html", {"request": request, "business": business})
 
 
 # Additional routes and handlers are defined below with similar docstrings and comments for clarity.
@@ -140,8 +164,9 @@ async def chat_page(request: Request, db: AsyncSession = Depends(get_db),
 
 @app.post("/chat", include_in_schema=False)
 async def chat_post(
+        request: Request,
         db: AsyncSession = Depends(get_db),
-        current_user: User = Depends(get_current_user),
+        current_user: CurrentUser = Depends(get_current_user),
 
         message: str = Form(...)
 ):
@@ -149,12 +174,13 @@ async def chat_post(
         Send message to AI for the current user.
 
         Args:
+            request (Request): The HTTP request object.
             db (Session): The database session.
-            current_user (User): The currently authenticated user.
+            current_user (CurrentUser): The currently authenticated user.
             message(str): The message sent by the user.
 
         Returns:
-            RedirectResponse: The rendered chat page.
+            JSONResponse with the reply for fetch/HTMX clients, otherwise a RedirectResponse to the chat page.
         """
     # Fetch business
 
@@ -170,7 +196,7 @@ async def chat_post(
         # Get last 20 messages for context (isolated by username for web chat)
         recent_messages = await get_conversation_history(
             business_id=business.id,
-            customer_id=current_user.id,
+            customer_id=current_user.username,
             customer_name=current_user.username,
             db=db)
 
@@ -180,41 +206,39 @@ async def chat_post(
             db=db,
             conversation_history=recent_messages,
             business_id=business.id,
-            user_name=current_user.username
+            user_name=current_user.username,
+            customer_id=current_user.username
         )
 
-        # Save user message
-        await update_conversation_history(
+        # Save the user message and bot response together (one INSERT, one commit)
+        await update_conversation_history_pair(
             db=db,
             business_id=business.id,
-            text=user_message,
+            user_text=user_message,
+            bot_text=bot_response,
             sender=current_user.username,
             customer_id=current_user.username,
             customer_name=current_user.username,
-            is_bot=False,
             platform="web"
         )
 
-        # Save bot response
-        await update_conversation_history(
-            db=db,
-            business_id=business.id,
-            text=bot_response,
-            sender="bot",
-            customer_id=current_user.username,
-            customer_name=current_user.username,
-            is_bot=True,
-            platform="web"
-        )
+        # ✅ Script clients get the reply in place instead of a redirect and a full page reload
+        if _wants_json(request):
+            return JSONResponse({"response": bot_response})
 
     return RedirectResponse(url="/chat", status_code=303)
 
 
+def _wants_json(request: Request) -> bool:
+    """True for fetch/HTMX requests that can take the reply directly."""
+    return "HX-Request" in request.headers or "application/json" in request.headers.get("accept", "")
+
+
 @app.get("/conversations", name="conversations")
 async def conversations_page(
         request: Request,
         db: AsyncSession = Depends(get_db),
-        current_user: User = Depends(get_current_user)
+        current_user: CurrentUser = Depends(get_current_user)
 ):
     """
     Render the conversations management page.
@@ -222,7 +246,7 @@ async def conversations_page(
     Args:
         request (Request): The HTTP request object.
         db (Session): The database session.
-        current_user (User): The currently authenticated user.
+        current_user (CurrentUser): The currently authenticated user.
 
     Returns:
         TemplateResponse: The rendered conversations page or a redirect if no business exists.
@@ -241,7 +265,7 @@ async def conversations_page(
 async def dashboard_page(
         request: Request,
         db: Annotated[AsyncSession, Depends(get_db)],
-        current_user: User = Depends(get_current_user)
+        current_user: CurrentUser = Depends(get_current_user)
 ):
     """
     Render the main dashboard page for the authenticated user.
@@ -249,24 +273,22 @@ async def dashboard_page(
     Args:
         request (Request): The HTTP request object.
         db (Session): The database session.
-        current_user (User): The currently authenticated user.
+        current_user (CurrentUser): The currently authenticated user.
 
     Returns:
         TemplateResponse: The rendered dashboard with business statistics.
     """
     business = await get_current_business(db, current_user)
-    products_result = await db.execute(
-        select(func.count())
-        .select_from(Product)
-        .where(Product.business_id == business.id)
+    # ✅ Both counts in one round trip (the business itself comes with the authenticated user)
+    counts_result = await db.execute(
+        select(
+            select(func.count()).select_from(Product)
+            .where(Product.business_id == business.id).scalar_subquery(),
+            select(func.count()).select_from(Order)
+            .where(Order.business_id == business.id).scalar_subquery(),
+        )
     )
-
-    products_count = products_result.scalar_one()
-
-    order_result = await db.execute(select(func.count())
-        .select_from(Order)
-        .where(Order.business_id == business.id))
-    order_count = order_result.scalar_one()
+    products_count, order_count = counts_result.one()
     # TODO 1: add orders, payments, payouts, invoices and ai credits to Business model.
     return templates.TemplateResponse(
         "dashboard.html",
@@ -302,14 +324,19 @@ async def login_post(
     )
     user = result.scalars().first()
 
-    # Invalid credentials → re-render login page
-    if not user or not check_password_hash(str(user.password_hash), password):
+    # Invalid credentials → re-render login page (hashing is CPU-bound, keep it off the event loop)
+    if not user or not await run_in_threadpool(verify_password, password, str(user.password_hash)):
         return templates.TemplateResponse(
             "login.html",
             {"request": request, "error": "Invalid credentials"},
             status_code=400
         )
 
+    # Upgrade legacy pbkdf2/scrypt hashes to argon2id on successful login
+    if password_needs_rehash(user.password_hash):
+        user.password_hash = await run_in_threadpool(hash_password, password)
+        await db.commit()
+
     # Create JWT
     access_token = create_access_token({"sub": str(user.id)})
 
@@ -328,7 +355,7 @@ async def login_post(
 
 
 @app.get("/login")
-def login(request: Request):
+async def login(request: Request):
     """
     Render the login page.
 
@@ -344,7 +371,7 @@ def login(request: Request):
 
 
 @app.get("/signup", name="signup")
-def signup_page(request: Request):
+async def signup_page(request: Request):
     return templates.TemplateResponse(request=request, name="signup.html")
 
 
@@ -370,27 +397,26 @@ async def signup_post(request: Request, db: Annotated[AsyncSession, Depends(get_
         return templates.TemplateResponse(request=request, name="signup.html",
                                           context={"error": "Please fill in all required fields"})
 
-    # Check if username or email already exists
-    user_check = await db.execute(select(User).where(User.username == func.lower(username)))
-    if user_check.first():
-        return templates.TemplateResponse(request=request, name="signup.html",
-                                          context={"error": "Username already exists"})
-    email_check = await db.execute(select(User).where(User.email == func.lower(email)))
-    if email_check.first():
-        return templates.TemplateResponse(request=request, name="signup.html",
-                                          context={"error": "Email already registered"})
+    # Check if username or email already exists (one query; both columns are uniquely indexed)
+    existing = (await db.execute(
+        select(User.username)
+        .where(or_(User.username == func.lower(username), User.email == func.lower(email)))
+        .limit(1)
+    )).first()
+    if existing:
+        error = "Username already exists" if existing.username == username.lower() else "Email already registered"
+        return templates.TemplateResponse(request=request, name="signup.html", context={"error": error})
 
     new_user = User(
         username=username,
         email=email,
-        password_hash=generate_password_hash(password, method='pbkdf2:sha256', salt_length=8)
+        password_hash=await run_in_threadpool(hash_password, password)
     )
     db.add(new_user)
-    await db.commit()
-    await db.refresh(new_user)
+    await db.flush()  # ensures new_user.id is available
 
-    new_business = Business(name=business_name, user_id=new_user.id)
-    db.add(new_business)
+    # ✅ User and business are created in one transaction
+    db.add(Business(name=business_name, user_id=new_user.id))
     await db.commit()
 
     return RedirectResponse(url="/login", status_code=status.HTTP_303_SEE_OTHER)
@@ -400,7 +426,7 @@ async def signup_post(request: Request, db: Annotated[AsyncSession, Depends(get_
 async def list_products(
         request: Request,
         db: Annotated[AsyncSession, Depends(get_db)],
-        current_user: User = Depends(get_current_user)
+        current_user: CurrentUser = Depends(get_current_user)
 ):
     """
     Render the products management page for the current business.
@@ -408,17 +434,18 @@ async def list_products(
     Args:
         request (Request): The HTTP request object.
         db (AsyncSession): The database session.
-        current_user (User): The currently authenticated user.
+        current_user (CurrentUser): The currently authenticated user.
 
     Returns:
         TemplateResponse: The rendered products page or a redirect if no business exists.
     """
-    business_result = await db.execute(select(Business).where(Business.user_id == current_user.id))
-    business = business_result.scalar_one()
+    business = current_user.business
     if not business:
         return RedirectResponse(url="/", status_code=303)
 
-    products_result = await db.execute(select(Product).where(Product.business_id == business.id))
+    products_result = await db.execute(
+        select(Product).where(Product.business_id == business.id).options(*LIST_LOAD_OPTIONS)
+    )
     business_products = products_result.scalars().all()
 
     return templates.TemplateResponse(
@@ -429,14 +456,14 @@ async def list_products(
 
 @app.post("/settings", tags=["Settings"])
 async def settings_post(request: Request, db: Annotated[AsyncSession, Depends(get_db)],
-                        current_user: User = Depends(get_current_user)):
+                        current_user: CurrentUser = Depends(get_current_user)):
     """
     Handle the settings form submission to update business profile.
 
     Args:
         request (Request): The HTTP request object containing form data.
         db (Session): The database session.
-        current_user (User): The currently authenticated user.
+        current_user (CurrentUser): The currently authenticated user.
 
     Returns:
         TemplateResponse: The rendered settings page with success or error messages.
@@ -449,8 +476,7 @@ async def settings_post(request: Request, db: Annotated[AsyncSession, Depends(ge
     phone_number_id = phone_number_id.strip() if phone_number_id and phone_number_id.strip() else None
     persona = persona.strip() if persona and persona.strip() else None
 
-    result = await db.execute(select(Business).where(Business.user_id == current_user.id))
-    business = result.scalar_one()
+    business = current_user.business
 
     if not business:
         return templates.TemplateResponse(
@@ -462,13 +488,12 @@ async def settings_post(request: Request, db: Annotated[AsyncSession, Depends(ge
 
     # Check if phone number is already taken by another business
     if phone_number_id:
-        existing_result = await db.execute(select(Business).where(
+        existing_result = await db.execute(select(Business.id).where(
             Business.phone_number_id == phone_number_id,
             Business.id != business.id
-        ))
-        existing = existing_result.scalar_one_or_none()
+        ).limit(1))
 
-        if existing:
+        if existing_result.scalar() is not None:
             return templates.TemplateResponse(
                 "settings.html",
                 {"request": request, "business": business,
@@ -476,10 +501,18 @@ async def settings_post(request: Request, db: Annotated[AsyncSession, Depends(ge
                  "category": "error"}
             )
 
-    business.phone_number_id = phone_number_id
-    business.persona = persona
+    # current_user.business is a read-only snapshot, so the change is written with an UPDATE
+    await db.execute(
+        update(Business).where(Business.id == business.id).values(phone_number_id=phone_number_id, persona=persona)
+    )
     await db.commit()
-    await db.refresh(business)
+    # ✅ Forget both ids only once the change is visible, so a webhook can't re-cache the old mapping
+    forget_phone_number(business.phone_number_id)
+    forget_phone_number(phone_number_id)
+    business = dataclasses.replace(business, phone_number_id=phone_number_id, persona=persona)
+    invalidate_persona(business.id)
+    invalidate_user_cache(current_user.id)
+    clear_response_cache(business.id)
 
     return templates.TemplateResponse(
         "settings.html",
@@ -489,20 +522,19 @@ async def settings_post(request: Request, db: Annotated[AsyncSession, Depends(ge
 
 @app.get("/settings", tags=["Settings"], name="settings")
 async def settings_page(request: Request, db: Annotated[AsyncSession, Depends(get_db)],
-                        current_user: User = Depends(get_current_user)):
+                        current_user: CurrentUser = Depends(get_current_user)):
     """
     Render the settings page for the current user's business.
 
     Args:
         request (Request): The HTTP request object.
         db (Session): The database session.
-        current_user (User): The currently authenticated user.
+        current_user (CurrentUser): The currently authenticated user.
 
     Returns:
         TemplateResponse: The rendered settings page with business details.
     """
-    result = await db.execute(select(Business).where(Business.user_id == current_user.id))
-    business = result.scalar_one()
+    business = current_user.business
 
     return templates.TemplateResponse(
         "settings.html",
@@ -510,14 +542,15 @@ async def settings_page(request: Request, db: Annotated[AsyncSession, Depends(ge
 
 
 @app.get("/logout", tags=["Users"])
-def logout():
+async def logout(request: Request):
+    forget_token(request.cookies.get("access_token"))
     response = RedirectResponse(url="/login", status_code=status.HTTP_303_SEE_OTHER)
     response.delete_cookie("access_token", secure=True, httponly=True, samesite="none")
     return response
 
 
 @app.get("/logout-page", tags=["Users"], include_in_schema=False)
-def logout_page(request: Request):
+async def logout_page(request: Request):
     return templates.TemplateResponse("logout.html",
                                       {"request": request})
 
@@ -538,8 +571,8 @@ async def add_to_mailing_list(request: Request, db: Annotated[AsyncSession, Depe
     email = form.get("email")
 
     # Check if email already exists
-    email_check = await db.execute(select(Mailinglist).where(Mailinglist.email == func.lower(email)))
-    if email_check.first():
+    email_check = await db.execute(select(Mailinglist.id).where(Mailinglist.email == func.lower(email)).limit(1))
+    if email_check.scalar() is not None:
         return templates.TemplateResponse(request=request, name="signup.html",
                                           context={"error": "Email already registered"})
 
@@ -548,7 +581,6 @@ async def add_to_mailing_list(request: Request, db: Annotated[AsyncSession, Depe
     )
     db.add(new_subscriber)
     await db.commit()
-    await db.refresh(new_subscriber)
 
     return RedirectResponse(url="https://omnilabsghana.tech/", status_code=status.HTTP_303_SEE_OTHER)
 
@@ -607,7 +639,9 @@ if __name__ == "__main__":
     # The host must be '0.0.0.0' to be accessible from outside the container
     host = "0.0.0.0"
 
-    # Run the Uvicorn server.
-    # In a real production environment, you might use a process manager like Gunicorn with Uvicorn workers,
-    # but this is suitable for many cloud platforms.
-    uvicorn.run(app, host=host, port=port)
+    # ✅ Worker processes from WEB_CONCURRENCY (default 1); each runs its own event loop, so chat turns
+    # waiting on the model or tools never block other users. Caches are per process.
+    workers = int(os.environ.get("WEB_CONCURRENCY", 1))
+
+    # Run the Uvicorn server (multiple workers need the app as an import string)
+    uvicorn.run("main:app" if workers > 1 else app, host=host, port=port, workers=workers)
@@ -0,0 +1,147 @@
+"""
+Live message notifications for the conversations page.
+
+Saving a message sends a Postgres NOTIFY that is delivered when the transaction commits. Each worker
+LISTENs on one dedicated connection and wakes the requests long-polling that conversation, so an
+open conversation with no new messages costs no queries.
+"""
+import asyncio
+import logging
+from contextlib import contextmanager
+
+import orjson
+from sqlalchemy import text
+
+from database import engine
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "new_message"
+# Seconds a long-poll waits for a new message; kept below common proxy idle timeouts
+LONG_POLL_TIMEOUT = 25
+# Without a listener (SQLite, or while the listen connection reconnects) long-polls degrade to plain polling
+FALLBACK_POLL_INTERVAL = 3
+# Reconnect backoff for the listen connection, in seconds
+RECONNECT_MIN_DELAY = 1
+RECONNECT_MAX_DELAY = 60
+# A half-open connection (e.g. dropped by a NAT or failover) never fires the termination listener,
+# so the listen connection is pinged this often and treated as disconnected if the ping fails
+LIVENESS_INTERVAL = 30
+LIVENESS_TIMEOUT = 5
+
+_USE_NOTIFY = engine.dialect.name == "postgresql"
+_NOTIFY_STMT = text(f"SELECT pg_notify('{CHANNEL}', :payload)")
+
+# (business_id, customer_id) -> events of the requests waiting on that conversation
+_waiters: dict[tuple, set[asyncio.Event]] = {}
+_listener_conn = None
+_listener_task: asyncio.Task | None = None
+
+
+async def publish(db, business_id, customer_id):
+    """Announce a new message in a conversation (call before the commit that saves it)."""
+    if not _USE_NOTIFY or customer_id is None:
+        return
+    await db.execute(_NOTIFY_STMT, {"payload": orjson.dumps([business_id, str(customer_id)]).decode()})
+
+
+def _on_notify(_connection, _pid, _channel, payload):
+    try:
+        key = tuple(orjson.loads(payload))
+    except orjson.JSONDecodeError:
+        return
+    for event in _waiters.get(key, ()):
+        event.set()
+
+
+def _wake_all():
+    for events in _waiters.values():
+        for event in events:
+            event.set()
+
+
+async def _listen_forever():
+    """Hold the LISTEN connection, pinging it periodically and reconnecting with exponential backoff whenever it drops."""
+    global _listener_conn
+    delay = RECONNECT_MIN_DELAY
+    while True:
+        disconnected = asyncio.Event()
+        conn = None
+        try:
+            conn = await engine.connect()
+            raw = await conn.get_raw_connection()
+            await raw.driver_connection.add_listener(CHANNEL, _on_notify)
+            raw.driver_connection.add_termination_listener(lambda _connection: disconnected.set())
+            _listener_conn = conn
+            delay = RECONNECT_MIN_DELAY
+            # Messages saved while disconnected sent no notification: have current long-polls re-query
+            _wake_all()
+            while not disconnected.is_set():
+                try:
+                    await asyncio.wait_for(disconnected.wait(), LIVENESS_INTERVAL)
+                except asyncio.TimeoutError:
+                    # Pinged on the driver connection: a SQLAlchemy execute would open a transaction,
+                    # and Postgres holds notifications back until it ends
+                    await asyncio.wait_for(raw.driver_connection.execute("SELECT 1"), LIVENESS_TIMEOUT)
+            logger.warning("Message notification listener disconnected; reconnecting")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning("Could not listen for message notifications, retrying in %ss: %s", delay, e)
+        finally:
+            _listener_conn = None
+            if conn is not None:
+                try:
+                    await conn.invalidate()
+                except Exception:
+                    pass
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, RECONNECT_MAX_DELAY)
+
+
+async def start_listener():
+    """Start this worker's LISTEN connection (call at startup); it reconnects on its own."""
+    global _listener_task
+    if not _USE_NOTIFY or _listener_task is not None:
+        return
+    _listener_task = asyncio.create_task(_listen_forever())
+
+
+async def stop_listener():
+    """Close the LISTEN connection (call at shutdown, before disposing the engine)."""
+    global _listener_task
+    task, _listener_task = _listener_task, None
+    if task is not None:
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+
+@contextmanager
+def subscription(business_id, customer_id):
+    """
+    Register interest in a conversation and yield the event set when it gets a new message.
+    Subscribe before checking for messages so one saved in between is not missed.
+    """
+    key = (business_id, str(customer_id))
+    event = asyncio.Event()
+    _waiters.setdefault(key, set()).add(event)
+    try:
+        yield event
+    finally:
+        waiting = _waiters.get(key)
+        if waiting is not None:
+            waiting.discard(event)
+            if not waiting:
+                del _waiters[key]
+
+
+async def wait(event):
+    """Wait until the subscription fires or the long-poll times out."""
+    timeout = LONG_POLL_TIMEOUT if _listener_conn is not None else FALLBACK_POLL_INTERVAL
+    try:
+        await asyncio.wait_for(event.wait(), timeout)
+    except asyncio.TimeoutError:
+        pass
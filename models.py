@@ -2,10 +2,9 @@ from __future__ import annotations
 import random
 from datetime import datetime
 
-from pgvector.sqlalchemy import Vector
-from sqlalchemy import DateTime, ForeignKey, Integer, String, Text, Float, Boolean, func, text
+from pgvector.sqlalchemy import HALFVEC, Vector
+from sqlalchemy import DateTime, ForeignKey, Integer, String, Text, Float, Boolean, Index, func, text
 from sqlalchemy.orm import Mapped, mapped_column, relationship, DeclarativeBase
-from werkzeug.security import generate_password_hash, check_password_hash
 
 
 class Base(DeclarativeBase):
@@ -57,16 +56,24 @@ class User(Base):
 
     def set_password(self, password):
         """Hash and set the user's password"""
-        self.password_hash = generate_password_hash(password)
+        from auth import hash_password  # auth imports models; import lazily
+        self.password_hash = hash_password(password)
 
     def check_password(self, password):
         """Check if the provided password matches the hash"""
-        return check_password_hash(self.password_hash, password)
+        from auth import verify_password
+        return verify_password(password, self.password_hash)
 
 
 # Message model
 class Message(Base):
     __tablename__ = 'messages'
+    __table_args__ = (
+        # ✅ Serves "latest N messages for a business" without scanning the table
+        Index('ix_messages_business_id_timestamp', 'business_id', 'timestamp'),
+        # ✅ Serves one customer's latest N messages as a (backward) index range scan
+        Index('ix_messages_business_customer_timestamp', 'business_id', 'customer_id', 'timestamp', 'id'),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
 
@@ -75,13 +82,16 @@ class Message(Base):
     platform: Mapped[str] = mapped_column(String(20), default='web', nullable=False)
 
     # Track the specific conversation
-    customer_id: Mapped[str | None] = mapped_column(String(120), nullable=True, index=True)
+    # Indexed via ix_messages_business_customer_timestamp; lookups are always scoped to a business
+    customer_id: Mapped[str | None] = mapped_column(String(120), nullable=True)
     customer_name: Mapped[str | None] = mapped_column(String(120), nullable=True)
 
     text: Mapped[str] = mapped_column(Text, nullable=True)
     sender: Mapped[str] = mapped_column(String(120), nullable=False)  # 'wa_id' or 'bot' or 'user'
     is_bot: Mapped[bool] = mapped_column(Boolean, default=False, nullable=False)
     timestamp: Mapped[datetime] = mapped_column(DateTime, default=func.now(), server_default=func.now())
+    # ✅ Text embedding for long-term memory recall, filled in the background after each turn
+    embedding = mapped_column(Vector(1408), nullable=True, deferred=True)
 
     # Relationship back to business
     business = relationship('Business', back_populates='messages_list', lazy=True)
@@ -89,6 +99,13 @@ class Message(Base):
 
 class Product(Base):
     __tablename__ = 'products'
+    __table_args__ = (
+        # ✅ ANN index so similarity search doesn't scan every embedding (partial: matches the
+        # searches' IS NOT NULL filter and skips products without images)
+        Index('ix_products_image_embedding', 'image_embedding', postgresql_using='hnsw',
+              postgresql_ops={'image_embedding': 'halfvec_cosine_ops'},
+              postgresql_where=text('image_embedding IS NOT NULL')),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
 
@@ -99,7 +116,9 @@ class Product(Base):
     price: Mapped[float] = mapped_column(Float, nullable=False)
     image_url: Mapped[str | None] = mapped_column(String(255), nullable=True)
     is_active: Mapped[bool] = mapped_column(Boolean, nullable=False, server_default=text('true'))
-    image_embedding = mapped_column(Vector(1408), nullable=True)
+    # Deferred: 1408 floats per row that only the pgvector queries read, so ORM product loads skip it.
+    # ✅ halfvec (FP16): half the bytes per row and per index entry of vector, with negligible recall loss
+    image_embedding = mapped_column(HALFVEC(1408), nullable=True, deferred=True)
     created_at: Mapped[datetime] = mapped_column(DateTime, server_default=func.now())
 
     business: Mapped["Business"] = relationship('Business', back_populates='products', lazy=True)
@@ -114,7 +133,8 @@ class Order(Base):
     __tablename__ = 'orders'
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
-    business_id: Mapped[int] = mapped_column(Integer, ForeignKey('businesses.id'), nullable=False)
+    # ✅ Indexed: the dashboard counts orders per business
+    business_id: Mapped[int] = mapped_column(Integer, ForeignKey('businesses.id'), nullable=False, index=True)
     customer_name: Mapped[str] = mapped_column(String(120), nullable=False)
     amount: Mapped[float] = mapped_column(Float, nullable=False)
     status: Mapped[str] = mapped_column(String(50), default='pending')  # pending, completed, cancelled
@@ -5,6 +5,7 @@ import os
 import uuid
 
 import httpx
+import orjson
 from dotenv import load_dotenv
 from fastapi import APIRouter, Request, HTTPException, Depends
 from sqlalchemy import select
@@ -45,7 +46,6 @@ async def create_order(customer_name: str, amount: float, db: AsyncSession, busi
         )
         db.add(new_order)
         await db.commit()
-        await db.refresh(new_order)
         logger.info(f"Order created successfully: ID {new_order.id} for business {business_id}")
         return new_order
 
@@ -83,7 +83,7 @@ async def initialize_payment(customer_email, customer_name, business_id: int, db
         async with httpx.AsyncClient() as client:
             response = await client.post(url, headers=headers, json=payload)
             response.raise_for_status()
-            data = response.json()
+            data = orjson.loads(response.content)
 
         # FIX: Inject the actual generated reference from the database order
         data['local_reference'] = order.reference
@@ -108,7 +108,6 @@ async def update_order_status(reference: str, status: str, db: AsyncSession):
 
         order.status = status
         await db.commit()
-        await db.refresh(order)
         return {
             "message": "Order status updated successfully",
             "reference": order.reference,
@@ -132,7 +131,7 @@ async def verify_payment(reference: str, db: AsyncSession):
         async with httpx.AsyncClient() as client:
             response = await client.get(url, headers=headers)
             response.raise_for_status()
-            paystack_data = response.json()
+            paystack_data = orjson.loads(response.content)
 
         # Safely extract the actual transaction status from Paystack's payload
         api_status = paystack_data.get("status")
@@ -199,7 +198,7 @@ async def paystack_webhook(request: Request, db: AsyncSession = Depends(get_db))
         raise HTTPException(status_code=401, detail="Invalid signature")
 
     # 2. Extract the event
-    event_data = await request.json()
+    event_data = orjson.loads(payload)
 
     if event_data.get('event') == 'charge.success':
         reference = event_data['data']['reference']
@@ -210,7 +209,7 @@ async def paystack_webhook(request: Request, db: AsyncSession = Depends(get_db))
 
         # 4. Final check
         if result.get('success'):
-            print(f"Transaction {reference} is officially verified via Webhook!")
+            logger.info("Transaction %s is officially verified via Webhook!", reference)
 
             # Since Paystack returns the customer info in the webhook, you can extract it here
             customer_phone = event_data['data']['customer'].get('phone')
@@ -1,29 +1,29 @@
+import logging
+
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.responses import RedirectResponse
-from datetime import datetime, timezone
 from sqlalchemy import delete
-from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
-from ai.run_ai import get_ai_response
-from database import get_db, get_current_user
-from models import Business, User, Message
+from ai import session_cache
+from ai.run_ai import get_ai_response, get_conversation_history, update_conversation_history_pair
+from database import get_db, get_current_user, CurrentUser
+from models import Message
 from schemas import ChatRequest
 
 router = APIRouter()
 
+logger = logging.getLogger(__name__)
+
 
 @router.post("/clear-session")
 async def clear_session(
         db: AsyncSession = Depends(get_db),
-        current_user: User = Depends(get_current_user)
+        current_user: CurrentUser = Depends(get_current_user)
 ):
     """Delete all messages associated with a specific business."""
 
     # Fetch business
-    results = await db.execute(
-        select(Business).where(Business.user_id == current_user.id)
-    )
-    business = results.scalar_one_or_none()
+    business = current_user.business
 
     if not business:
         raise HTTPException(status_code=400, detail="No business found for this account.")
@@ -35,8 +35,11 @@ async def clear_session(
             Message.platform == "web"
         )
     )
-    print(f"{result.rowcount} messages were deleted by user")
+    logger.info(f"{result.rowcount} messages were deleted by user")
     await db.commit()
+    # The web chat is keyed by the owner's username (as in api_chat_post); WhatsApp histories are untouched
+    await session_cache.clear(business.id, current_user.username)
+    await session_cache.clear_customers(business.id)
     return RedirectResponse(url="/chat", status_code=status.HTTP_303_SEE_OTHER)
 
     
@@ -45,13 +48,10 @@ async def clear_session(
 async def api_chat_post(
         request: ChatRequest,
         db: AsyncSession = Depends(get_db),
-        current_user: User = Depends(get_current_user)
+        current_user: CurrentUser = Depends(get_current_user)
 ):
     # Fetch business
-    results = await db.execute(
-        select(Business).where(Business.user_id == current_user.id)
-    )
-    business = results.scalar_one_or_none()
+    business = current_user.business
 
     if not business:
         raise HTTPException(status_code=400, detail="No business found for this account.")
@@ -59,53 +59,31 @@ async def api_chat_post(
     user_message = request.message.strip()
 
     if user_message:
-        # Get last 20 messages for context
-        result = await db.execute(
-            select(Message)
-            .where(
-                Message.business_id == business.id,
-                Message.platform == "web"
-            )
-            .order_by(Message.timestamp.desc())
-            .limit(20)
-        )
-
-        recent_messages = result.scalars().all()
-
-        conversation_history = [
-            {"text": msg.text, "sender": msg.sender, "is_bot": msg.is_bot}
-            for msg in reversed(recent_messages)
-        ]
-
-        # Save user message
-        user_msg = Message(
+        # Recent context for this user (Redis tail, falling back to the indexed per-customer query)
+        conversation_history = await get_conversation_history(
             business_id=business.id,
-            text=user_message,
-            sender="user",
-            is_bot=False,
-            platform="web",
-            timestamp=datetime.now(timezone.utc).replace(tzinfo=None)
-        )
-        db.add(user_msg)
-        await db.commit()
+            customer_id=current_user.username,
+            customer_name=current_user.username,
+            db=db)
 
         # AI response
-        bot_response = await get_ai_response(user_message, db, conversation_history, business_id=business.id)
+        bot_response = await get_ai_response(user_message, db, conversation_history, business_id=business.id,
+                                             user_name=current_user.username, customer_id=current_user.username)
 
         if not bot_response or not bot_response.strip():
             bot_response = "I'm sorry, I couldn't generate a response."
 
-        # Save bot message
-        bot_msg = Message(
+        # Save the user message and reply together (one INSERT, one commit, one cache append)
+        await update_conversation_history_pair(
+            db=db,
             business_id=business.id,
-            text=bot_response,
-            sender="bot",
-            is_bot=True,
-            platform="web",
-            timestamp=datetime.now(timezone.utc).replace(tzinfo=None)
+            user_text=user_message,
+            bot_text=bot_response,
+            sender=current_user.username,
+            customer_id=current_user.username,
+            customer_name=current_user.username,
+            platform="web"
         )
-        db.add(bot_msg)
-        await db.commit()
 
         return {"response": bot_response}
     return {"response": "I didn't catch that."}
@@ -1,16 +1,23 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
 from sqlalchemy import select, func
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from database import get_db, get_current_user
-from models import User, Message
+from database import get_db, get_current_user, CurrentUser
+import message_events
+from models import Message
+from ai import session_cache
 from ai.run_ai import update_conversation_history
 from whatsapp_bot.app.config import whatsapp_settings
-from whatsapp_bot.app.utils.whatsapp_utils import toggle_ai_status, get_text_message_input, send_message, AI_DISABLED_USERS
+from whatsapp_bot.app.utils.whatsapp_utils import toggle_ai_status, get_text_message_input, send_message, \
+    get_ai_disabled_users
 
 router = APIRouter(tags=["Conversations"])
 
+# Characters of each customer's latest message shown in the conversation list
+LAST_MESSAGE_PREVIEW_CHARS = 100
+
 
 class ToggleAIRequest(BaseModel):
     customer_id: str
@@ -18,96 +25,134 @@ class ToggleAIRequest(BaseModel):
     message: str | None = None
 
 
-@router.get("/api/customers")
-async def get_customers(
-        db: AsyncSession = Depends(get_db),
-        current_user: User = Depends(get_current_user)
-):
-    business = current_user.business
-    if not business:
-        return {"customers": []}
-
-    # Subquery to find the latest timestamp for each customer
-    latest_msg_subq = (
+async def _load_customers(db, business_id):
+    # ✅ One aggregate pass per customer: message count and latest message id (ids follow the
+    # (timestamp, id) order the history uses, so ties between a saved user/bot pair resolve correctly)
+    per_customer = (
         select(
             Message.customer_id,
-            func.max(Message.timestamp).label("max_ts")
+            func.count(Message.id).label("msg_count"),
+            func.max(Message.id).label("last_id"),
         )
-        .where(Message.business_id == business.id)
+        .where(Message.business_id == business_id)
         .where(Message.customer_id.isnot(None))
         .group_by(Message.customer_id)
         .subquery()
     )
 
-    # Subquery to count messages per customer
-    count_subq = (
+    # Only the columns the list shows; the preview is trimmed in SQL
+    stmt = (
         select(
             Message.customer_id,
-            func.count(Message.id).label("msg_count")
+            Message.customer_name,
+            func.substr(Message.text, 1, LAST_MESSAGE_PREVIEW_CHARS).label("text"),
+            Message.timestamp,
+            per_customer.c.msg_count,
         )
-        .where(Message.business_id == business.id)
-        .where(Message.customer_id.isnot(None))
-        .group_by(Message.customer_id)
-        .subquery()
-    )
-
-    # Main query: Join Message with subqueries to get details of the latest message + count
-    stmt = (
-        select(Message, count_subq.c.msg_count)
-        .join(latest_msg_subq,
-              (Message.customer_id == latest_msg_subq.c.customer_id) &
-              (Message.timestamp == latest_msg_subq.c.max_ts)
-              )
-        .join(count_subq, Message.customer_id == count_subq.c.customer_id)
-        .where(Message.business_id == business.id)
-        .order_by(Message.timestamp.desc())
+        .join(per_customer, Message.id == per_customer.c.last_id)
+        .order_by(Message.timestamp.desc(), Message.id.desc())
     )
 
     result = await db.execute(stmt)
-    results = result.all()
 
     customers = []
-    for row in results:
-        msg = row[0]
-        count = row[1]
+    for row in result.all():
         customers.append({
-            "id": msg.customer_id,
-            "name": msg.customer_name or msg.customer_id,
-            "last_message": msg.text,
-            "last_timestamp": msg.timestamp.strftime("%Y-%m-%d %H:%M:%S"),
-            "message_count": count,
-            "ai_enabled": msg.customer_id not in AI_DISABLED_USERS
+            "id": row.customer_id,
+            "name": row.customer_name or row.customer_id,
+            "last_message": row.text,
+            "last_timestamp": row.timestamp.strftime("%Y-%m-%d %H:%M:%S"),
+            "message_count": row.msg_count,
         })
 
-    return {"customers": customers}
+    return customers
+
+
+@router.get("/api/customers")
+async def get_customers(
+        db: AsyncSession = Depends(get_db),
+        current_user: CurrentUser = Depends(get_current_user)
+):
+    business = current_user.business
+    if not business:
+        return {"customers": []}
+
+    # ✅ The list only changes when a message is saved, which drops the cached copy; AI status is
+    # toggled independently, so it is applied on every read rather than cached
+    customers = await session_cache.get_customers(business.id)
+    if customers is None:
+        generation = await session_cache.customers_generation(business.id)
+        customers = await _load_customers(db, business.id)
+        await session_cache.set_customers(business.id, customers, generation)
+
+    ai_disabled_users = await get_ai_disabled_users()
+    for customer in customers:
+        customer["ai_enabled"] = customer["id"] not in ai_disabled_users
+
+    # Already plain JSON types: returning the response directly skips FastAPI's jsonable_encoder walk
+    return ORJSONResponse({"customers": customers})
+
+
+def _message_json(m):
+    return {
+        "id": m.id,
+        "text": m.text,
+        "timestamp": m.timestamp.strftime("%H:%M"),
+        "is_bot": m.is_bot
+    }
 
 
 @router.get("/api/customer-messages/{customer_id}")
 async def get_customer_messages(
         customer_id: str,
+        limit: int = Query(50, ge=1, le=200),
+        before_id: int | None = None,
+        after_id: int | None = None,
         db: AsyncSession = Depends(get_db),
-        current_user: User = Depends(get_current_user)
+        current_user: CurrentUser = Depends(get_current_user)
 ):
+    """
+    Return one page of a customer's messages (the latest ``limit``, or those older than ``before_id``).
+
+    With ``after_id`` this is a long-poll: it returns the messages newer than ``after_id``, waiting
+    until one arrives (or the poll times out) when there are none yet.
+    """
     business = current_user.business
     if not business:
         return {"messages": []}
+    business_id = business.id
+
+    if after_id is not None:
+        stmt = (
+            select(Message.id, Message.text, Message.timestamp, Message.is_bot)
+            .where(Message.business_id == business_id)
+            .where(Message.customer_id == customer_id)
+            .where(Message.id > after_id)
+            .order_by(Message.id)
+            .limit(limit)
+        )
+        with message_events.subscription(business_id, customer_id) as new_message:
+            msgs = (await db.execute(stmt)).all()
+            if not msgs:
+                # ✅ Return the connection to the pool while waiting; the session reconnects for the re-query
+                await db.close()
+                await message_events.wait(new_message)
+                msgs = (await db.execute(stmt)).all()
+        return {"messages": [_message_json(m) for m in msgs]}
 
-    result = await db.execute(
-        select(Message)
-        .where(Message.business_id == business.id)
+    stmt = (
+        select(Message.id, Message.text, Message.timestamp, Message.is_bot)
+        .where(Message.business_id == business_id)
         .where(Message.customer_id == customer_id)
-        .order_by(Message.timestamp)
     )
-    msgs = result.scalars().all()
+    if before_id is not None:
+        stmt = stmt.where(Message.id < before_id)
+    result = await db.execute(stmt.order_by(Message.timestamp.desc(), Message.id.desc()).limit(limit))
+    msgs = list(reversed(result.all()))
 
     return {
-        "messages": [
-            {
-                "text": m.text,
-                "timestamp": m.timestamp.strftime("%H:%M"),
-                "is_bot": m.is_bot
-            } for m in msgs
-        ]
+        "messages": [_message_json(m) for m in msgs],
+        "has_more": len(msgs) == limit
     }
 
 
@@ -115,14 +160,14 @@ async def get_customer_messages(
 async def toggle_ai(
         request: ToggleAIRequest,
         db: AsyncSession = Depends(get_db),
-        current_user: User = Depends(get_current_user)
+        current_user: CurrentUser = Depends(get_current_user)
 ):
     business = current_user.business
     if not business:
         raise HTTPException(status_code=400, detail="User has no business")
 
     # Toggle AI status
-    toggle_ai_status(request.customer_id, request.enable_ai)
+    await toggle_ai_status(request.customer_id, request.enable_ai)
 
     # If a message is provided, send it via WhatsApp
     if request.message:
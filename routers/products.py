@@ -1,3 +1,4 @@
+import logging
 import os
 import uuid
 from datetime import datetime, timezone
@@ -5,18 +6,22 @@ from typing import Annotated
 
 from PIL import Image
 from fastapi import APIRouter, Depends, HTTPException, status, Form, UploadFile, File
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import RedirectResponse
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import selectinload
 
-from ai.image_embeddings import generate_image_embedding
-from database import get_db, get_current_user
-from models import Product, Business, User
+from ai.image_embeddings import generate_image_embedding_from_bytes
+from ai.response_cache import clear_response_cache
+from ai.tools import invalidate_product_cache
+from database import get_db, get_current_user, LIST_LOAD_OPTIONS, CurrentUser
+from models import Product, Business
 from schemas import ProductResponse, ProductUpdate, ProductCreate
 
 router = APIRouter()
 
+logger = logging.getLogger(__name__)
+
 # Directory where product images are stored
 MEDIA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "media", "products")
 os.makedirs(MEDIA_DIR, exist_ok=True)
@@ -25,8 +30,8 @@ ALLOWED_EXTENSIONS = {".jpg", ".jpeg", ".png", ".gif", ".webp", ".bmp"}
 MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
 
 
-def save_upload_file(upload_file: UploadFile) -> tuple[str, str]:
-    """Save an uploaded file and return the filename and absolute file path."""
+def save_upload_file(upload_file: UploadFile) -> tuple[str, str, bytes]:
+    """Save an uploaded file and return the filename, absolute file path and raw bytes."""
     # Validate extension
     ext = os.path.splitext(upload_file.filename or "")[1].lower()
     if ext not in ALLOWED_EXTENSIONS:
@@ -62,31 +67,30 @@ def save_upload_file(upload_file: UploadFile) -> tuple[str, str]:
     with open(filepath, "wb") as f:
         f.write(contents)
 
-    return filename, filepath
+    return filename, filepath, contents
 
 
 @router.get("/api/v1/products/{business_id}", response_model=list[ProductResponse], tags=["Products"])
 async def get_products(business_id: int, db: AsyncSession = Depends(get_db)):
     result = await db.execute(
-        select(Product).where(Product.business_id == business_id))
+        select(Product).where(Product.business_id == business_id).options(*LIST_LOAD_OPTIONS))
     products = result.scalars().all()
     return products
 
 
 @router.get("/{business_id}/products", response_model=list[ProductResponse])
 async def get_business_products(business_id: int, db: AsyncSession = Depends(get_db)):
-    result = await db.execute(select(Business).where(Business.id == business_id))
-    business = result.scalars().first()
-    if not business:
+    result = await db.execute(select(Business.id).where(Business.id == business_id))
+    if result.scalar() is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Business not found",
         )
     result = await db.execute(
         select(Product)
-        .options(selectinload(Product.business))
         .where(Product.business_id == business_id)
-        .order_by(Product.created_at.desc()),
+        .order_by(Product.created_at.desc())
+        .options(*LIST_LOAD_OPTIONS),
     )
     products = result.scalars().all()
     return products
@@ -99,19 +103,16 @@ async def add_product(
         description: str = Form(None),
         image: UploadFile | None = File(None),
         db: AsyncSession = Depends(get_db),
-        current_user: User = Depends(get_current_user)
+        current_user: CurrentUser = Depends(get_current_user)
 ):
-    result = await db.execute(
-        select(Business).where(Business.user_id == current_user.id)
-    )
-    business = result.scalars().first()
+    business = current_user.business
 
     if not business:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Business not found")
 
     existing = await db.execute(
-        select(Product).where(Product.name == name, Product.business_id == business.id))
-    if existing.scalars().first():
+        select(Product.id).where(Product.name == name, Product.business_id == business.id).limit(1))
+    if existing.scalar() is not None:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Product already exists")
 
     # Handle image upload and embedding
@@ -119,15 +120,15 @@ async def add_product(
     image_embedding = None
 
     if image and image.filename:
-        filename, filepath = save_upload_file(image)
+        filename, filepath, contents = await run_in_threadpool(save_upload_file, image)
         image_url = f"/media/products/{filename}"
 
-        # Generate vector embedding from the image
+        # Generate vector embedding from the image (reuses the upload bytes, no re-read)
         try:
-            embedding = generate_image_embedding(filepath)
+            embedding = await run_in_threadpool(generate_image_embedding_from_bytes, contents, filename)
             image_embedding = embedding
         except Exception as e:
-            print(f"[WARNING] Failed to generate embedding for new product: {e}")
+            logger.warning(f"Failed to generate embedding for new product: {e}")
 
     new_product = Product(
         name=name,
@@ -140,7 +141,8 @@ async def add_product(
     )
     db.add(new_product)
     await db.commit()
-    await db.refresh(new_product)
+    clear_response_cache(business.id)
+    invalidate_product_cache(business.id)
     return RedirectResponse(url="/products", status_code=status.HTTP_303_SEE_OTHER)
 
 
@@ -160,7 +162,8 @@ async def update_product(product_id: int, product: ProductUpdate, db: AsyncSessi
         existing_product.description = product.description
 
     await db.commit()
-    await db.refresh(existing_product)
+    clear_response_cache(existing_product.business_id)
+    invalidate_product_cache(existing_product.business_id)
     return existing_product
 
 
@@ -183,18 +186,19 @@ async def update_product_image(
             os.remove(old_path)
 
     # Save new image
-    filename, filepath = save_upload_file(image)
+    filename, filepath, contents = await run_in_threadpool(save_upload_file, image)
     product.image_url = f"/media/products/{filename}"
 
     # Generate new embedding
     try:
-        embedding = generate_image_embedding(filepath)
+        embedding = await run_in_threadpool(generate_image_embedding_from_bytes, contents, filename)
         product.image_embedding = embedding
     except Exception as e:
-        print(f"[WARNING] Failed to generate embedding for updated image: {e}")
+        logger.warning(f"Failed to generate embedding for updated image: {e}")
 
     await db.commit()
-    await db.refresh(product)
+    clear_response_cache(product.business_id)
+    invalidate_product_cache(product.business_id)
     return {"message": "Image updated", "image_url": product.image_url}
 
 
@@ -205,6 +209,7 @@ async def replace_product(product_id: int, product: ProductCreate, db: Annotated
     if not db_product:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Product not found")
 
+    previous_business_id = db_product.business_id
     db_product.name = product.name
     db_product.price = product.price
     db_product.description = product.description
@@ -212,7 +217,10 @@ async def replace_product(product_id: int, product: ProductCreate, db: Annotated
         db_product.business_id = product.business_id
 
     await db.commit()
-    await db.refresh(db_product)
+    clear_response_cache(previous_business_id)
+    invalidate_product_cache(previous_business_id)
+    clear_response_cache(db_product.business_id)
+    invalidate_product_cache(db_product.business_id)
     return db_product
 
 
@@ -231,3 +239,5 @@ async def delete_product(product_id: int, db: AsyncSession = Depends(get_db)):
 
     await db.delete(product)
     await db.commit()
+    clear_response_cache(product.business_id)
+    invalidate_product_cache(product.business_id)
@@ -2,16 +2,17 @@ from datetime import timedelta
 from typing import Annotated
 
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy import func, select, or_
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from auth import (
     create_access_token,
-    verify_password, hash_password, verify_access_token, oauth2_scheme
+    verify_password, hash_password, password_needs_rehash, verify_access_token, oauth2_scheme
 )
 from config import settings
-from database import get_db
+from database import get_db, invalidate_user_cache
 from models import User, Business
 from schemas import Token, UserResponse, SignupRequest, UserPrivate, UserUpdate, UserPublic
 
@@ -19,7 +20,7 @@ router = APIRouter()
 
 
 @router.post("/signup", response_model=UserResponse, status_code=status.HTTP_201_CREATED, tags=["Users"])
-def create_user(request: SignupRequest, db: Annotated[Session, Depends(get_db)]):
+async def create_user(request: SignupRequest, db: Annotated[AsyncSession, Depends(get_db)]):
     username = request.username.strip()
     email = request.email
     password = request.password.strip()
@@ -32,16 +33,20 @@ def create_user(request: SignupRequest, db: Annotated[Session, Depends(get_db)])
             detail="Username, password, and business name are required."
         )
 
-    # Prevent duplicates
-    if (db.execute(select(User).where(User.username == username))).scalar():
-        raise HTTPException(status_code=400, detail="Username already exists.")
-
-    if email and (db.execute(select(User).where(User.email == email))).scalar():
+    # Prevent duplicates (username and email in one query)
+    existing = (await db.execute(
+        select(User.username)
+        .where(or_(User.username == username, User.email == email) if email else User.username == username)
+        .limit(1)
+    )).first()
+    if existing:
+        if existing.username == username:
+            raise HTTPException(status_code=400, detail="Username already exists.")
         raise HTTPException(status_code=400, detail="Email already exists.")
 
-    if phone_number_id and (db.execute(
-            select(Business).where(Business.phone_number_id == phone_number_id)
-    )).scalar():
+    if phone_number_id and (await db.execute(
+            select(Business.id).where(Business.phone_number_id == phone_number_id).limit(1)
+    )).scalar() is not None:
         raise HTTPException(status_code=400, detail="This WhatsApp phone number is already registered.")
 
     # Atomic transaction
@@ -49,10 +54,11 @@ def create_user(request: SignupRequest, db: Annotated[Session, Depends(get_db)])
         new_user = User(
             username=username,
             email=email or "",
-            password_hash=hash_password(password)
+            # argon2 is CPU-bound; hash off the event loop
+            password_hash=await run_in_threadpool(hash_password, password)
         )
         db.add(new_user)
-        db.flush()  # ensures new_user.id is available
+        await db.flush()  # ensures new_user.id is available
 
         new_business = Business(
             name=business_name,
@@ -61,23 +67,23 @@ def create_user(request: SignupRequest, db: Annotated[Session, Depends(get_db)])
         )
         db.add(new_business)
 
-        db.commit()
-        db.refresh(new_user)
+        await db.commit()
+        await db.refresh(new_user)
         return new_user
 
     except Exception:
-        db.rollback()
+        await db.rollback()
         raise
 
 
 @router.post("/token", response_model=Token)
-def login_for_access_token(
+async def login_for_access_token(
         form_data: Annotated[OAuth2PasswordRequestForm, Depends()],
-        db: Annotated[Session, Depends(get_db)],
+        db: Annotated[AsyncSession, Depends(get_db)],
 ):
     # Look up user by email (case-insensitive)
     # Note: OAuth2PasswordRequestForm uses "username" field, but we treat it as email
-    result = db.execute(
+    result = await db.execute(
         select(User).where(
             or_(
                 func.lower(User.username) == func.lower(form_data.username),
@@ -89,13 +95,18 @@ def login_for_access_token(
 
     # Verify user exists and password is correct
     # Don't reveal which one failed (security best practice)
-    if not user or not verify_password(form_data.password, user.password_hash):
+    if not user or not await run_in_threadpool(verify_password, form_data.password, user.password_hash):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
 
+    # Upgrade legacy werkzeug / outdated argon2 hashes now that the plaintext is known
+    if password_needs_rehash(user.password_hash):
+        user.password_hash = await run_in_threadpool(hash_password, form_data.password)
+        await db.commit()
+
     # Create access token with user id as subject
     access_token_expires = timedelta(minutes=settings.access_token_expire_minutes)
     access_token = create_access_token(
@@ -106,9 +117,9 @@ def login_for_access_token(
 
 
 @router.get("/me", response_model=UserPrivate)
-def get_current_user(
+async def get_current_user(
         token: Annotated[str, Depends(oauth2_scheme)],
-        db: Annotated[Session, Depends(get_db)],
+        db: Annotated[AsyncSession, Depends(get_db)],
 ):
     """Get the currently authenticated user."""
     user_id = verify_access_token(token)
@@ -129,7 +140,7 @@ def get_current_user(
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-    result = db.execute(
+    result = await db.execute(
         select(User).where(User.id == user_id_int),
     )
     user = result.scalars().first()
@@ -143,8 +154,8 @@ def get_current_user(
 
 
 @router.get("/{user_id}", response_model=UserPublic)
-def get_user(user_id: int, db: Annotated[Session, Depends(get_db)]):
-    result = db.execute(select(User).where(User.id == user_id))
+async def get_user(user_id: int, db: Annotated[AsyncSession, Depends(get_db)]):
+    result = await db.execute(select(User).where(User.id == user_id))
     user = result.scalars().first()
     if user:
         return user
@@ -152,12 +163,12 @@ def get_user(user_id: int, db: Annotated[Session, Depends(get_db)]):
 
 
 @router.patch("/{user_id}", response_model=UserPrivate)
-def update_user(
+async def update_user(
         user_id: int,
         user_update: UserUpdate,
-        db: Annotated[Session, Depends(get_db)],
+        db: Annotated[AsyncSession, Depends(get_db)],
 ):
-    result = db.execute(select(User).where(User.id == user_id))
+    result = await db.execute(select(User).where(User.id == user_id))
     user = result.scalars().first()
     if not user:
         raise HTTPException(
@@ -168,13 +179,12 @@ def update_user(
             user_update.username is not None
             and user_update.username.lower() != user.username.lower()
     ):
-        result = db.execute(
-            select(User).where(
+        result = await db.execute(
+            select(User.id).where(
                 User.username == user_update.username.lower(),
-            ),
+            ).limit(1),
         )
-        existing_user = result.scalars().first()
-        if existing_user:
+        if result.scalar() is not None:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Username already exists",
@@ -183,13 +193,12 @@ def update_user(
             user_update.email is not None
             and user_update.email.lower() != user.email.lower()
     ):
-        result = db.execute(
-            select(User).where(
+        result = await db.execute(
+            select(User.id).where(
                 User.email == user_update.email.lower(),
-            ),
+            ).limit(1),
         )
-        existing_email = result.scalars().first()
-        if existing_email:
+        if result.scalar() is not None:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Email already registered",
@@ -202,14 +211,14 @@ def update_user(
     if user_update.image_file is not None:
         user.image_file = user_update.image_file
 
-    db.commit()
-    db.refresh(user)
+    await db.commit()
+    invalidate_user_cache(user.id)
     return user
 
 
 @router.delete("/{user_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_user(user_id: int, db: Annotated[Session, Depends(get_db)]):
-    result = db.execute(select(User).where(User.id == user_id))
+async def delete_user(user_id: int, db: Annotated[AsyncSession, Depends(get_db)]):
+    result = await db.execute(select(User).where(User.id == user_id))
     user = result.scalars().first()
     if not user:
         raise HTTPException(
@@ -217,6 +226,7 @@ def delete_user(user_id: int, db: Annotated[Session, Depends(get_db)]):
             detail="User not found",
         )
 
-    db.delete(user)
-    db.commit()
+    await db.delete(user)
+    await db.commit()
+    invalidate_user_cache(user_id)
 
@@ -1,5 +1,8 @@
+import atexit
 import logging
+import queue
 import sys
+from logging.handlers import QueueHandler, QueueListener
 
 from pydantic import SecretStr
 from pydantic_settings import BaseSettings, SettingsConfigDict
@@ -23,13 +26,28 @@ class WhatsAppSettings(BaseSettings):
     verify_token: SecretStr
 
 
+_log_listener: QueueListener | None = None
+
+
 def configure_logging():
-    """Configure logging for WhatsApp bot"""
-    logging.basicConfig(
-        level=logging.INFO,
-        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-        stream=sys.stdout,
-    )
+    """Configure logging for WhatsApp bot.
+
+    Records are handed to a queue and written to stdout by a background thread,
+    so request handlers never block on the stream.
+    """
+    global _log_listener
+    if _log_listener is not None:
+        return
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s"))
+
+    log_queue = queue.SimpleQueue()
+    _log_listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _log_listener.start()
+    atexit.register(_log_listener.stop)
+
+    logging.basicConfig(level=logging.INFO, handlers=[QueueHandler(log_queue)], force=True)
 
 
 # Global settings instance
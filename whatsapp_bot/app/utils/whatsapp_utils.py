@@ -1,35 +1,79 @@
-import base64
 import logging
 import re
 import time
 
 import httpx
+import orjson
+import pybase64
+from cachetools import TTLCache
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 
-from ai.run_ai import get_ai_response, get_conversation_history, update_conversation_history, clear_conversation_history
+from ai import session_cache
+from ai.run_ai import get_ai_response, get_conversation_history, update_conversation_history, \
+    clear_conversation_history, schedule_conversation_write
 from models import Business
 from ..config import whatsapp_settings
 
-# Global set to store users who have AI disabled
+# Users this worker has turned AI off for; the fallback when Redis (shared by all workers) is unavailable
 AI_DISABLED_USERS = set()
 
+# ✅ The shared disabled set is read from Redis at most every few seconds per worker
+_ai_disabled_cache = TTLCache(maxsize=1, ttl=5)
+
 # Global cache to store processed message IDs for deduplication
 PROCESSED_MESSAGE_IDS = {}
 
+# ✅ Business (id, name) per WhatsApp phone_number_id, so bursts of webhooks skip the lookup.
+# Only found businesses are cached. forget_phone_number only reaches the worker that saved the
+# settings, so the TTL is kept to a few seconds to bound misrouting on the others.
+_business_by_phone = TTLCache(maxsize=1024, ttl=5)
+
+
+def forget_phone_number(phone_number_id):
+    """Drop a cached phone_number_id → business mapping (call after changing a business's number)."""
+    if phone_number_id is not None:
+        _business_by_phone.pop(str(phone_number_id), None)
+
+
+async def _get_business_by_phone(phone_number_id, db: AsyncSession):
+    key = str(phone_number_id)
+    business = _business_by_phone.get(key)
+    if business is None:
+        result = await db.execute(select(Business.id, Business.name).where(Business.phone_number_id == key))
+        business = result.first()
+        if business is not None:
+            _business_by_phone[key] = business
+    return business
+
 
-def toggle_ai_status(wa_id: str, enable: bool):
+async def toggle_ai_status(wa_id: str, enable: bool):
     if enable:
-        if wa_id in AI_DISABLED_USERS:
-            AI_DISABLED_USERS.remove(wa_id)
+        AI_DISABLED_USERS.discard(wa_id)
     else:
         AI_DISABLED_USERS.add(wa_id)
+    await session_cache.set_ai_disabled(wa_id, not enable)
+    _ai_disabled_cache.clear()
+
+
+async def get_ai_disabled_users() -> set[str]:
+    """Return the users with AI turned off, shared across workers via Redis."""
+    users = _ai_disabled_cache.get("users")
+    if users is None:
+        users = await session_cache.get_ai_disabled()
+        if users is None:
+            return AI_DISABLED_USERS
+        _ai_disabled_cache["users"] = users
+    return users
 
 
 def log_http_response(response):
-    logging.info(f"Status: {response.status_code}")
-    logging.info(f"Content-type: {response.headers.get('content-type')}")
-    logging.info(f"Body: {response.text}")
+    # Called for every outbound send: only decode and format the response when INFO is enabled
+    if not logging.getLogger().isEnabledFor(logging.INFO):
+        return
+    logging.info("Status: %s", response.status_code)
+    logging.info("Content-type: %s", response.headers.get('content-type'))
+    logging.info("Body: %s", response.text)
 
 
 def get_text_message_input(recipient: str, text: str):
@@ -97,7 +141,7 @@ async def get_media_url(media_id):
     async with httpx.AsyncClient() as client:
         response = await client.get(url, headers=headers)
         response.raise_for_status()
-        return response.json().get("url")
+        return orjson.loads(response.content).get("url")
 
 
 async def download_media(media_url):
@@ -108,7 +152,7 @@ async def download_media(media_url):
     async with httpx.AsyncClient() as client:
         response = await client.get(media_url, headers=headers)
         response.raise_for_status()
-        return base64.b64encode(response.content).decode("utf-8")
+        return pybase64.b64encode_as_string(response.content)
 
 
 async def send_typing_indicator(message_id: str, phone_number_id: str, access_token: str = None):
@@ -149,7 +193,7 @@ async def process_whatsapp_message(body, db: AsyncSession):
                 del PROCESSED_MESSAGE_IDS[mid]
 
         if message_id in PROCESSED_MESSAGE_IDS:
-            logging.info(f"Skipping duplicate message ID: {message_id}")
+            logging.info("Skipping duplicate message ID: %s", message_id)
             return
         PROCESSED_MESSAGE_IDS[message_id] = current_time
 
@@ -179,11 +223,7 @@ async def process_whatsapp_message(body, db: AsyncSession):
     phone_number_id = body["entry"][0]["changes"][0]["value"]["metadata"]["phone_number_id"]
 
     # ✅ Find the business associated with this phone number
-    result = await db.execute(
-        select(Business)
-        .where(Business.phone_number_id == phone_number_id
-               ))
-    business = result.scalars().first()
+    business = await _get_business_by_phone(phone_number_id, db)
 
     if not business:
         logging.error(f"No business found for phone_number_id: {phone_number_id}")
@@ -198,35 +238,46 @@ async def process_whatsapp_message(body, db: AsyncSession):
         phone_number_id=phone_number_id,
         access_token=whatsapp_settings.access_token.get_secret_value()
     )
-    logging.info(f"Processing message for business: {business.name} (ID: {business.id})")
+    logging.info("Processing message for business: %s (ID: %s)", business.name, business.id)
 
-    # ✅ Save incoming user message to database
-    await update_conversation_history(
+    # ✅ Check if AI is enabled for this user
+    ai_disabled_users = await get_ai_disabled_users()
+    if name in ai_disabled_users or wa_id in ai_disabled_users:
+        logging.info("AI response disabled for user %s. Skipping AI generation.", name)
+        await update_conversation_history(
+            business_id=business.id,
+            text=message_body,
+            sender=wa_id,
+            customer_id=wa_id,
+            customer_name=name,
+            is_bot=False,
+            db=db,
+            platform="whatsapp"
+        )
+        return
+
+    # ✅ Get recent messages for context (isolated by customer), before this message is saved
+    conversation_history = await get_conversation_history(business.id, wa_id, customer_name=None, db=db)
+
+    # ✅ Save incoming user message on its own session while the reply is generated
+    save_incoming = schedule_conversation_write(
         business_id=business.id,
         text=message_body,
         sender=wa_id,
         customer_id=wa_id,
         customer_name=name,
         is_bot=False,
-        db=db,
         platform="whatsapp"
     )
 
-    # ✅ Check if AI is enabled for this user
-    if name in AI_DISABLED_USERS or wa_id in AI_DISABLED_USERS:
-        logging.info(f"AI response disabled for user {name}. Skipping AI generation.")
-        return
-
-    # ✅ Get recent messages for context (isolated by customer)
-    conversation_history = await get_conversation_history(business.id, wa_id, customer_name=None, db=db)
-
     # ✅ Get AI response with business context
     if message_body.lower() == "refresh":
+        await save_incoming
         await clear_conversation_history(db, business_id=business.id, customer_id=wa_id)
         response = "History refreshed. How can I help you today?"
     else:
         response = await get_ai_response(message_body, db, conversation_history, business_id=business.id, user_name=name,
-                                         image_data=image_data, image_url=media_url)
+                                         image_data=image_data, image_url=media_url, customer_id=wa_id)
 
     # Process for WhatsApp formatting
     response = process_text_for_whatsapp(response)
@@ -240,7 +291,8 @@ async def process_whatsapp_message(body, db: AsyncSession):
     data = get_text_message_input(wa_id, response)
     await send_message(data, phone_number_id=phone_number_id)
 
-    # ✅ Save bot response to database
+    # ✅ Save bot response to database (after the incoming message, so history stays in order)
+    await save_incoming
     await update_conversation_history(
         business_id=business.id,
         text=response,
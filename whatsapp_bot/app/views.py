@@ -1,7 +1,7 @@
-import json
 import logging
 import os
 
+import orjson
 from fastapi import APIRouter, Request, Depends, HTTPException, status, BackgroundTasks
 from fastapi.responses import JSONResponse, PlainTextResponse
 from sqlalchemy.orm import Session
@@ -35,8 +35,8 @@ async def webhook_post(
     - read
     """
     try:
-        body = await request.json()
-    except json.JSONDecodeError:
+        body = orjson.loads(await request.body())
+    except orjson.JSONDecodeError:
         logging.error("Failed to decode JSON")
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,